@@ -4,14 +4,17 @@ Streamlit application for RAG Website Chatbot.
 
 import os
 import time
+import asyncio
 import logging
-from typing import Optional
+import threading
+from queue import Queue, Empty
+from typing import Callable, Optional
 import streamlit as st
 from dotenv import load_dotenv
 from src.crawler import WebCrawler
-from src.knowledge_base import KnowledgeBase
+from src.knowledge_base import KnowledgeBase, EmbeddingCache
 from src.rag_pipeline import RAGPipeline
-from src.utils import is_valid_url, format_time
+from src.utils import is_valid_url, format_time, format_bytes
 
 # Configure logging
 logging.basicConfig(
@@ -103,6 +106,10 @@ def initialize_session_state():
         st.session_state.crawled_url = None
     if 'kb_stats' not in st.session_state:
         st.session_state.kb_stats = None
+    if 'build_job' not in st.session_state:
+        st.session_state.build_job = None
+    if 'build_notice' not in st.session_state:
+        st.session_state.build_notice = None
 
 
 def validate_api_keys() -> tuple[Optional[str], Optional[str]]:
@@ -118,10 +125,32 @@ def validate_api_keys() -> tuple[Optional[str], Optional[str]]:
     return groq_key, google_key
 
 
-def crawl_and_build_kb(url: str, max_depth: int, max_pages: int, 
-                       chunk_size: int, chunk_overlap: int):
+@st.cache_resource(show_spinner=False)
+def get_embedding_cache() -> EmbeddingCache:
     """
-    Crawl website and build knowledge base.
+    Get the chunk embedding cache shared by all builds with the default model.
+    
+    Rebuilding a website with different settings, or crawling it again,
+    then only encodes chunks whose text changed. The cache keeps the most
+    recently used embeddings, so it stays bounded however many sites are built.
+    
+    Returns:
+        Mapping of chunk text hashes to embeddings
+    """
+    return EmbeddingCache()
+
+
+@st.cache_resource(show_spinner=False, max_entries=10)
+def build_kb_cached(url: str, max_depth: int, max_pages: int,
+                    chunk_size: int, chunk_overlap: int,
+                    _on_page_crawled: Optional[Callable[[int, int], None]] = None,
+                    _on_status: Optional[Callable[[str], None]] = None,
+                    _should_stop: Optional[Callable[[], bool]] = None) -> tuple[KnowledgeBase, dict]:
+    """
+    Crawl website and build its knowledge base, cached per URL and settings.
+    
+    The result is shared across reruns and sessions, so crawling the same
+    website again with the same settings returns instantly.
     
     Args:
         url: Website URL to crawl
@@ -129,85 +158,237 @@ def crawl_and_build_kb(url: str, max_depth: int, max_pages: int,
         max_pages: Maximum pages to crawl
         chunk_size: Text chunk size
         chunk_overlap: Chunk overlap size
-    """
-    try:
-        # Create crawler
-        crawler = WebCrawler(url, max_depth=max_depth, max_pages=max_pages)
-        
-        # Show progress
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        # Start crawling
-        status_text.text("🕷️ Starting web crawler...")
-        progress_bar.progress(10)
-        
-        start_time = time.time()
-        crawled_data = crawler.crawl()
-        crawl_time = time.time() - start_time
-        
-        if not crawled_data:
-            st.error("❌ No content was extracted from the website. Please check the URL and try again.")
-            return False
+        _on_page_crawled: Called with (pages_crawled, max_pages) after each
+            page is crawled; not part of the cache key (optional)
+        _on_status: Called with a status label when the build moves to the
+            next step; not part of the cache key (optional)
+        _should_stop: Polled during the crawl; returning True cancels the
+            build; not part of the cache key (optional)
         
-        progress_bar.progress(40)
-        status_text.text(f"✅ Crawled {len(crawled_data)} pages in {format_time(crawl_time)}")
-        
-        # Build knowledge base
-        status_text.text("🔨 Building knowledge base...")
-        progress_bar.progress(60)
-        
-        kb_start_time = time.time()
-        kb = KnowledgeBase()
-        kb.build_from_crawled_data(crawled_data, chunk_size=chunk_size, 
-                                    chunk_overlap=chunk_overlap)
-        kb_time = time.time() - kb_start_time
-        
-        progress_bar.progress(80)
-        status_text.text("🔗 Initializing RAG pipeline...")
-        
-        # Initialize RAG pipeline
-        groq_key, google_key = validate_api_keys()
-        if not groq_key:
-            st.error("❌ GROQ_API_KEY not found. Please set it in your .env file.")
-            return False
-        
-        rag_pipeline = RAGPipeline(kb, groq_key, google_key)
-        
-        # Store in session state
-        st.session_state.kb = kb
-        st.session_state.rag_pipeline = rag_pipeline
-        st.session_state.crawled_url = url
-        st.session_state.kb_stats = kb.get_stats()
-        
-        progress_bar.progress(100)
-        status_text.text("✅ Knowledge base ready!")
-        
-        # Show stats
-        total_time = time.time() - start_time
-        crawler_stats = crawler.get_stats()
-        kb_stats = kb.get_stats()
-        
-        st.markdown(f"""
-        <div class="success-box">
-            <h4>✅ Knowledge Base Built Successfully!</h4>
-            <ul>
-                <li><b>Pages crawled:</b> {crawler_stats['pages_crawled']}</li>
-                <li><b>Text chunks created:</b> {kb_stats['total_chunks']}</li>
-                <li><b>Unique sources:</b> {kb_stats['unique_sources']}</li>
-                <li><b>Crawl time:</b> {format_time(crawl_time)}</li>
-                <li><b>KB build time:</b> {format_time(kb_time)}</li>
-                <li><b>Total time:</b> {format_time(total_time)}</li>
-            </ul>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        return True
+    Returns:
+        Tuple of (knowledge_base, build_stats) where build_stats holds the
+        crawler stats plus crawl_time and kb_time in seconds
+    """
+    # Crawl website
+    crawler = WebCrawler(url, max_depth=max_depth, max_pages=max_pages,
+                         progress_callback=_on_page_crawled, should_stop=_should_stop)
+    
+    start_time = time.time()
+    crawled_data = asyncio.run(crawler.crawl())
+    crawl_time = time.time() - start_time
+    
+    if _should_stop and _should_stop():
+        # A partial crawl must not end up in the cache
+        raise RuntimeError("Crawl cancelled")
+    
+    if not crawled_data:
+        # Raising keeps the failure out of the cache so the URL can be retried
+        raise ValueError("No content was extracted from the website. Please check the URL and try again.")
+    
+    # Build knowledge base
+    if _on_status:
+        _on_status(f"🔨 Building knowledge base from {len(crawled_data)} pages...")
+    kb_start_time = time.time()
+    kb = KnowledgeBase(embedding_cache=get_embedding_cache())
+    kb.build_from_crawled_data(crawled_data, chunk_size=chunk_size, 
+                                chunk_overlap=chunk_overlap)
+    kb_time = time.time() - kb_start_time
+    
+    build_stats = {
+        **crawler.get_stats(),
+        'crawl_time': crawl_time,
+        'kb_time': kb_time
+    }
+    
+    return kb, build_stats
+
+
+@st.cache_resource(show_spinner=False, max_entries=10)
+def get_rag_pipeline(_kb: KnowledgeBase, kb_id: int, groq_key: str,
+                     google_key: Optional[str]) -> RAGPipeline:
+    """
+    Create the RAG pipeline for a knowledge base, cached per knowledge base.
+    
+    Args:
+        _kb: Knowledge base for retrieval (not hashed by Streamlit)
+        kb_id: id() of the knowledge base, used as the cache key
+        groq_key: Groq API key
+        google_key: Google API key for fallback (optional)
         
+    Returns:
+        RAG pipeline bound to the knowledge base
+    """
+    return RAGPipeline(_kb, groq_key, google_key)
+
+
+def _build_worker(job: dict, url: str, max_depth: int, max_pages: int,
+                  chunk_size: int, chunk_overlap: int):
+    """
+    Crawl website and build knowledge base on a background thread.
+    
+    The worker never calls Streamlit itself; it reports through the job's
+    queues, which show_build_progress() drains on the script thread.
+    
+    Args:
+        job: Build job created by start_build()
+        url: Website URL to crawl
+        max_depth: Maximum crawl depth
+        max_pages: Maximum pages to crawl
+        chunk_size: Text chunk size
+        chunk_overlap: Chunk overlap size
+    """
+    progress = job['progress']
+    try:
+        result = build_kb_cached(
+            url, max_depth, max_pages, chunk_size, chunk_overlap,
+            _on_page_crawled=lambda pages_crawled, total_pages: progress.put(('pages', pages_crawled, total_pages)),
+            _on_status=lambda label: progress.put(('status', label)),
+            _should_stop=job['cancel'].is_set
+        )
+        job['result'].put(('done', result))
     except Exception as e:
-        logger.error(f"Error in crawl_and_build_kb: {str(e)}")
-        st.error(f"❌ Error: {str(e)}")
-        return False
+        logger.error(f"Error building knowledge base: {str(e)}")
+        job['result'].put(('error', e))
+
+
+def start_build(url: str, max_depth: int, max_pages: int, 
+                chunk_size: int, chunk_overlap: int):
+    """
+    Start crawling the website and building its knowledge base in the background.
+    
+    The script run returns immediately, so reruns (e.g. moving a slider)
+    don't interrupt the build and the user can cancel it.
+    
+    Args:
+        url: Website URL to crawl
+        max_depth: Maximum crawl depth
+        max_pages: Maximum pages to crawl
+        chunk_size: Text chunk size
+        chunk_overlap: Chunk overlap size
+    """
+    job = {
+        'url': url,
+        'progress': Queue(),
+        'result': Queue(),
+        'cancel': threading.Event(),
+        'start_time': time.time(),
+        'fraction': 0.0,
+        'label': "🕷️ Starting web crawler..."
+    }
+    job['thread'] = threading.Thread(
+        target=_build_worker,
+        args=(job, url, max_depth, max_pages, chunk_size, chunk_overlap),
+        daemon=True
+    )
+    job['thread'].start()
+    
+    st.session_state.build_job = job
+    st.session_state.build_notice = None
+
+
+@st.fragment(run_every=0.5)
+def show_build_progress():
+    """
+    Show progress of the background build and finish it when it is done.
+    
+    Runs as a fragment every half second, so only this part of the page
+    is redrawn while the build is in progress.
+    """
+    job = st.session_state.build_job
+    if job is None:
+        return
+    
+    # Drain progress events; only the latest state is drawn
+    while True:
+        try:
+            event = job['progress'].get_nowait()
+        except Empty:
+            break
+        if event[0] == 'pages':
+            _, pages_crawled, total_pages = event
+            job['fraction'] = 0.7 * pages_crawled / total_pages
+            job['label'] = f"🕷️ Crawled {pages_crawled} of up to {total_pages} pages"
+        else:
+            job['fraction'], job['label'] = 0.7, event[1]
+    
+    try:
+        outcome, value = job['result'].get_nowait()
+    except Empty:
+        st.progress(job['fraction'], text=job['label'])
+        if job['cancel'].is_set():
+            st.caption("⏹️ Stopping after the requests in flight...")
+        elif st.button("⏹️ Cancel"):
+            job['cancel'].set()
+        return
+    
+    st.session_state.build_job = None
+    if outcome == 'done':
+        kb, build_stats = value
+        finish_build(job, kb, build_stats)
+    elif job['cancel'].is_set():
+        st.session_state.build_notice = ('info', "⏹️ Crawl cancelled.")
+    else:
+        st.session_state.build_notice = ('error', f"❌ Error: {str(value)}")
+    
+    # Redraw the whole page so the chat interface appears
+    st.rerun()
+
+
+def finish_build(job: dict, kb: KnowledgeBase, build_stats: dict):
+    """
+    Set up the RAG pipeline for a finished build and store it in session state.
+    
+    Args:
+        job: Finished build job
+        kb: Knowledge base built by the job
+        build_stats: Crawl and build statistics from build_kb_cached()
+    """
+    # Initialize RAG pipeline
+    groq_key, google_key = validate_api_keys()
+    if not groq_key:
+        st.session_state.build_notice = ('error', "❌ GROQ_API_KEY not found. Please set it in your .env file.")
+        return
+    
+    rag_pipeline = get_rag_pipeline(kb, id(kb), groq_key, google_key)
+    
+    # Store in session state
+    kb_stats = kb.get_stats()
+    st.session_state.kb = kb
+    st.session_state.rag_pipeline = rag_pipeline
+    st.session_state.crawled_url = job['url']
+    st.session_state.kb_stats = kb_stats
+    
+    # Keep the stats to show after the page is redrawn
+    total_time = time.time() - job['start_time']
+    st.session_state.build_notice = ('success', f"""
+    <div class="success-box">
+        <h4>✅ Knowledge Base Built Successfully!</h4>
+        <ul>
+            <li><b>Pages crawled:</b> {build_stats['pages_crawled']}</li>
+            <li><b>Text chunks created:</b> {kb_stats['total_chunks']}</li>
+            <li><b>Unique sources:</b> {kb_stats['unique_sources']}</li>
+            <li><b>Index size:</b> {format_bytes(kb_stats['index_bytes'])}</li>
+            <li><b>Crawl time:</b> {format_time(build_stats['crawl_time'])}</li>
+            <li><b>KB build time:</b> {format_time(build_stats['kb_time'])}</li>
+            <li><b>Total time:</b> {format_time(total_time)}</li>
+        </ul>
+    </div>
+    """)
+
+
+def display_build_notice():
+    """Display the outcome of the last build, if any."""
+    if not st.session_state.build_notice:
+        return
+    
+    kind, message = st.session_state.build_notice
+    if kind == 'success':
+        st.markdown(message, unsafe_allow_html=True)
+        st.success("✅ Ready to chat! Scroll down to start asking questions.")
+    elif kind == 'error':
+        st.error(message)
+    else:
+        st.info(message)
 
 
 def display_setup_page():
@@ -278,19 +459,41 @@ def display_setup_page():
     
     st.markdown("---")
     
-    # Crawl button
-    if st.button("🕷️ Crawl & Build Knowledge Base", type="primary"):
+    # Crawl button (disabled while a build is running)
+    if st.button("🕷️ Crawl & Build Knowledge Base", type="primary",
+                 disabled=st.session_state.build_job is not None):
         if not url:
             st.error("❌ Please enter a website URL")
         elif not is_valid_url(url):
             st.error("❌ Please enter a valid URL (must start with http:// or https://)")
         else:
-            with st.spinner("Processing website..."):
-                success = crawl_and_build_kb(url, max_depth, max_pages, 
-                                            chunk_size, chunk_overlap)
-                if success:
-                    st.success("✅ Ready to chat! Scroll down to start asking questions.")
-                    st.rerun()
+            start_build(url, max_depth, max_pages, chunk_size, chunk_overlap)
+    
+    if st.session_state.build_job is not None:
+        show_build_progress()
+    
+    display_build_notice()
+
+
+def display_sources(sources: Optional[list]):
+    """
+    Display source cards for an answer.
+    
+    Args:
+        sources: Source dictionaries returned by the RAG pipeline
+    """
+    if not sources:
+        return
+    
+    with st.expander("📚 View Sources"):
+        for i, source in enumerate(sources, 1):
+            st.markdown(f"""
+            <div class="source-card">
+                <b>Source {i}:</b> {source.get('title', 'Untitled')}<br>
+                <a href="{source.get('url', '#')}" target="_blank">{source.get('url', '#')}</a><br>
+                <small>Relevance: {source.get('similarity_score', 0):.2%}</small>
+            </div>
+            """, unsafe_allow_html=True)
 
 
 def display_chat_interface():
@@ -320,6 +523,7 @@ def display_chat_interface():
             st.session_state.chat_history = []
             st.session_state.crawled_url = None
             st.session_state.kb_stats = None
+            st.session_state.build_notice = None
             st.rerun()
     
     st.markdown("---")
@@ -337,16 +541,7 @@ def display_chat_interface():
                 st.markdown(f"**🤖 Assistant:** {content}")
                 
                 # Display sources if available
-                if 'sources' in message and message['sources']:
-                    with st.expander("📚 View Sources"):
-                        for i, source in enumerate(message['sources'], 1):
-                            st.markdown(f"""
-                            <div class="source-card">
-                                <b>Source {i}:</b> {source.get('title', 'Untitled')}<br>
-                                <a href="{source.get('url', '#')}" target="_blank">{source.get('url', '#')}</a><br>
-                                <small>Relevance: {source.get('similarity_score', 0):.2%}</small>
-                            </div>
-                            """, unsafe_allow_html=True)
+                display_sources(message.get('sources'))
             
             st.markdown("---")
     
@@ -370,23 +565,30 @@ def display_chat_interface():
             'content': user_question
         })
         
-        # Generate response
-        with st.spinner("🤔 Thinking..."):
+        # Stream the response into the chat history area
+        with chat_container:
+            st.markdown(f"**👤 You:** {user_question}")
+            st.markdown("---")
+            
             try:
-                response = st.session_state.rag_pipeline.answer_question(
-                    user_question,
-                    chat_history=st.session_state.chat_history
-                )
+                with st.spinner("🤔 Thinking..."):
+                    response = st.session_state.rag_pipeline.answer_question_stream(
+                        user_question,
+                        chat_history=st.session_state.chat_history
+                    )
+                
+                st.markdown("**🤖 Assistant:**")
+                answer = st.write_stream(response['answer_stream'])
+                display_sources(response.get('sources'))
+                st.markdown("---")
                 
                 # Add assistant response to history
                 st.session_state.chat_history.append({
                     'role': 'assistant',
-                    'content': response['answer'],
+                    'content': answer,
                     'sources': response.get('sources', [])
                 })
                 
-                st.rerun()
-                
             except Exception as e:
                 logger.error(f"Error generating response: {str(e)}")
                 st.error(f"❌ Error generating response: {str(e)}")
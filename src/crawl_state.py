@@ -0,0 +1,182 @@
+"""
+Persistent crawl state backed by SQLite.
+"""
+
+import json
+import time
+import sqlite3
+import logging
+from typing import List, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CrawlState:
+    """
+    Crawl queue, visited URLs and crawled pages stored in a SQLite database.
+    
+    The database runs in WAL mode and writes are committed in batches, so the
+    queue and visited set do not have to fit in memory, and an interrupted
+    crawl loses at most the last uncommitted batch when it is resumed. URLs
+    taken from the queue only count as visited once they have been fetched;
+    any still in flight when a run stops are queued again on the next open.
+    """
+    
+    def __init__(self, path: str, commit_every: int = 100):
+        """
+        Open (or create) the crawl state database.
+        
+        Args:
+            path: Path to the SQLite database file
+            commit_every: Number of writes between commits (default: 100)
+        """
+        self.path = path
+        self.commit_every = commit_every
+        self._pending_writes = 0
+        
+        self.con = sqlite3.connect(path)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        self.con.execute("CREATE TABLE IF NOT EXISTS visited(url TEXT PRIMARY KEY)")
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS queue("
+            "url TEXT PRIMARY KEY, depth INT, enqueued_at REAL, taken INT NOT NULL DEFAULT 0)"
+        )
+        self.con.execute("CREATE INDEX IF NOT EXISTS queue_order ON queue(taken, depth, enqueued_at)")
+        self.con.execute("CREATE TABLE IF NOT EXISTS pages(url TEXT PRIMARY KEY, data TEXT)")
+        
+        # URLs taken by a run that stopped before fetching them go back in the queue
+        self.con.execute("UPDATE queue SET taken = 0 WHERE taken = 1")
+        self.con.commit()
+        
+        self._visited_count = self.con.execute("SELECT COUNT(*) FROM visited").fetchone()[0]
+        
+        logger.info(f"Opened crawl state at {path}")
+    
+    def _record_writes(self, count: int = 1):
+        """Commit once enough writes have accumulated."""
+        self._pending_writes += count
+        if self._pending_writes >= self.commit_every:
+            self.flush()
+    
+    def flush(self):
+        """Commit pending writes."""
+        self.con.commit()
+        self._pending_writes = 0
+    
+    def close(self):
+        """Commit pending writes and close the database. Closing twice is a no-op."""
+        if self.con is None:
+            return
+        
+        self.flush()
+        self.con.close()
+        self.con = None
+    
+    def is_seen(self, url: str) -> bool:
+        """
+        Check if a URL has been visited or is waiting in the queue.
+        
+        Args:
+            url: URL to check
+            
+        Returns:
+            True if the URL is already known
+        """
+        row = self.con.execute(
+            "SELECT 1 FROM visited WHERE url = ? UNION ALL SELECT 1 FROM queue WHERE url = ? LIMIT 1",
+            (url, url)
+        ).fetchone()
+        return row is not None
+    
+    def enqueue(self, url: str, depth: int) -> bool:
+        """
+        Add a URL to the queue unless it is already known.
+        
+        Args:
+            url: URL to crawl
+            depth: Depth the URL was found at
+            
+        Returns:
+            True if the URL was added
+        """
+        if self.is_seen(url):
+            return False
+        
+        self.con.execute(
+            "INSERT OR IGNORE INTO queue(url, depth, enqueued_at) VALUES (?, ?, ?)",
+            (url, depth, time.time())
+        )
+        self._record_writes()
+        return True
+    
+    def pop_batch(self, limit: int) -> List[Tuple[str, int]]:
+        """
+        Take up to `limit` URLs at the shallowest queued depth.
+        
+        The URLs stay in the queue, but are not handed out again, until they
+        are passed to `mark_visited`.
+        
+        Args:
+            limit: Maximum number of URLs to take
+            
+        Returns:
+            List of (url, depth) tuples in the order they were queued
+        """
+        depth = self.con.execute("SELECT MIN(depth) FROM queue WHERE taken = 0").fetchone()[0]
+        if depth is None:
+            return []
+        
+        batch = self.con.execute(
+            "SELECT url, depth FROM queue WHERE taken = 0 AND depth = ? ORDER BY enqueued_at LIMIT ?",
+            (depth, limit)
+        ).fetchall()
+        
+        self.con.executemany("UPDATE queue SET taken = 1 WHERE url = ?", [(url,) for url, _ in batch])
+        self._record_writes(len(batch))
+        
+        return batch
+    
+    def mark_visited(self, urls: List[str]):
+        """
+        Move fetched URLs from the queue to the visited set.
+        
+        Args:
+            urls: URLs taken with `pop_batch` whose fetch has completed
+        """
+        rows = [(url,) for url in urls]
+        self.con.executemany("DELETE FROM queue WHERE url = ?", rows)
+        cursor = self.con.executemany("INSERT OR IGNORE INTO visited(url) VALUES (?)", rows)
+        self._visited_count += cursor.rowcount
+        self._record_writes(len(rows))
+    
+    def add_page(self, page: Dict):
+        """
+        Store the extracted content of a crawled page.
+        
+        Args:
+            page: Page data from the crawler
+        """
+        self.con.execute(
+            "INSERT OR REPLACE INTO pages(url, data) VALUES (?, ?)",
+            (page['url'], json.dumps(page))
+        )
+        self._record_writes()
+    
+    def load_pages(self) -> List[Dict]:
+        """
+        Load every page stored so far, in the order they were crawled.
+        
+        Returns:
+            List of page data dictionaries
+        """
+        rows = self.con.execute("SELECT data FROM pages ORDER BY rowid").fetchall()
+        return [json.loads(data) for (data,) in rows]
+    
+    def visited_count(self) -> int:
+        """Number of URLs fetched so far, still available once the database is closed."""
+        return self._visited_count
+    
+    def queue_size(self) -> int:
+        """Number of URLs waiting in the queue."""
+        return self.con.execute("SELECT COUNT(*) FROM queue").fetchone()[0]
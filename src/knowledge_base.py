@@ -3,31 +3,299 @@ Knowledge base construction using embeddings and FAISS vector store.
 """
 
 import os
+import mmap
 import pickle
+import hashlib
 import logging
-from typing import List, Dict, Optional
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, List, Dict, Optional, Tuple
 import numpy as np
+import orjson
 import faiss
-from sentence_transformers import SentenceTransformer
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from src.utils import clean_text
 
+# Rust text splitter; it breaks chunks at the same kinds of boundaries as the
+# LangChain splitter used when it isn't installed, several times faster
+try:
+    from semantic_text_splitter import TextSplitter
+except ImportError:
+    TextSplitter = None
+
+# torch and sentence-transformers take seconds to import, so they are imported
+# when the first knowledge base is created rather than with this module
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=8)
+def _get_text_splitter(chunk_size: int, chunk_overlap: int) -> Callable[[str], List[str]]:
+    """Create a text splitter once per chunk size and overlap; it keeps no state between texts."""
+    if TextSplitter is not None:
+        # Splits at the largest semantic level (paragraphs, lines, sentences,
+        # words) that fits, with whitespace trimmed from the chunk ends
+        # It requires the overlap to be smaller than the chunk size, which
+        # LangChain (and the app's sliders) allow to be equal
+        return TextSplitter(chunk_size, overlap=min(chunk_overlap, chunk_size - 1)).chunks
+    
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    
+    # Split at paragraphs, then lines, then after sentence-ending punctuation,
+    # keeping the punctuation at the end of the sentence so chunks (and their
+    # overlaps) start and end on whole sentences
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", r"(?<=[.!?]) ", " ", ""],
+        is_separator_regex=True,
+        keep_separator="end"
+    ).split_text
+
+
+def split_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """
+    Split text into overlapping chunks.
+    
+    Args:
+        text: Text to split
+        chunk_size: Size of each chunk in characters
+        chunk_overlap: Overlap between chunks in characters
+        
+    Returns:
+        List of chunk texts
+    """
+    return _get_text_splitter(chunk_size, chunk_overlap)(text)
+
+
+@lru_cache(maxsize=4)
+def load_embedding_model(model_name: str, device: str, backend: str = 'torch',
+                         model_file_name: Optional[str] = None) -> Tuple['SentenceTransformer', str, int]:
+    """
+    Load a sentence transformer model, once per process for each set of arguments.
+    
+    Every knowledge base built with the same model shares the loaded model
+    (encoding doesn't change it), so only the first one pays the load time.
+    
+    Args:
+        model_name: Name of the sentence transformer model
+        device: Device to run the model on
+        backend: Inference backend: 'torch', 'onnx' or 'openvino'
+        model_file_name: Model file to load for the onnx/openvino backend (optional)
+        
+    Returns:
+        Tuple of (model, backend actually used, embedding dimension)
+    """
+    from sentence_transformers import SentenceTransformer
+    
+    model = None
+    if backend != 'torch':
+        try:
+            model_kwargs = {'file_name': model_file_name} if model_file_name else None
+            model = SentenceTransformer(model_name, device=device,
+                                        backend=backend, model_kwargs=model_kwargs)
+        except Exception as e:
+            logger.warning(f"Could not load {backend} backend, using torch: {str(e)}")
+            backend = 'torch'
+    if model is None:
+        model = SentenceTransformer(model_name, device=device)
+    
+    # Get embedding dimension
+    dimension = model.encode(["test"]).shape[1]
+    return model, backend, dimension
+
+
+class ChunkTexts(Sequence):
+    """
+    Read-only list of chunk texts backed by a memory-mapped file.
+    
+    The texts are stored as one UTF-8 blob with an array of offsets, so
+    loading costs nothing up front and a text is only decoded (and paged in)
+    when it is accessed.
+    """
+    
+    __slots__ = ('_offsets', '_buffer')
+    
+    def __init__(self, path: str, offsets: np.ndarray):
+        """
+        Map a blob of chunk texts.
+        
+        Args:
+            path: Path to the concatenated UTF-8 texts
+            offsets: Start offset of each text, plus the end of the last one
+        """
+        self._offsets = offsets
+        self._buffer = b''
+        if offsets[-1] > 0:
+            with open(path, 'rb') as f:
+                self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    @staticmethod
+    def write(path: str, texts: List[str]) -> np.ndarray:
+        """
+        Write texts as one UTF-8 blob.
+        
+        Args:
+            path: Path of the blob file
+            texts: Texts to write
+            
+        Returns:
+            Offsets array to pass to ChunkTexts()
+        """
+        offsets = np.zeros(len(texts) + 1, dtype='int64')
+        
+        # Write a new file and swap it in: the texts may be a ChunkTexts mapped
+        # onto `path` itself, and truncating a mapped file makes reads crash
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for i, text in enumerate(texts):
+                data = text.encode('utf-8')
+                f.write(data)
+                offsets[i + 1] = offsets[i] + len(data)
+        os.replace(tmp_path, path)
+        return offsets
+    
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+    
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        
+        return self._buffer[self._offsets[i]:self._offsets[i + 1]].decode('utf-8')
+
+
+class EmbeddingCache(OrderedDict):
+    """
+    Chunk text hash -> embedding mapping that keeps the most recently used entries.
+    
+    Meant to be shared between knowledge bases built in one long-running
+    process, where a plain dict would grow with every site ever built.
+    """
+    
+    # About 150 MB of float32 embeddings for a 384-dimensional model
+    DEFAULT_MAX_ENTRIES = 100_000
+    
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        Create an empty cache.
+        
+        Args:
+            max_entries: Number of embeddings kept; the least recently used
+                are evicted beyond this (default: DEFAULT_MAX_ENTRIES)
+        """
+        super().__init__()
+        self.max_entries = max_entries
+        
+        # Builds in different threads share the cache
+        self._lock = threading.Lock()
+    
+    def __getitem__(self, key: str) -> np.ndarray:
+        with self._lock:
+            value = super().__getitem__(key)
+            self.move_to_end(key)
+            return value
+    
+    def __setitem__(self, key: str, value: np.ndarray):
+        with self._lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            while len(self) > self.max_entries:
+                self.popitem(last=False)
+    
+    def snapshot(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Copy out the cached embeddings for some keys, consistently with concurrent builds.
+        
+        Args:
+            keys: Keys to look up; missing ones are skipped
+            
+        Returns:
+            Mapping of the cached keys to their embeddings
+        """
+        embeddings = {}
+        with self._lock:
+            for key in keys:
+                if key in self:
+                    embeddings[key] = super().__getitem__(key)
+        return embeddings
+
+
 class KnowledgeBase:
     """
     Knowledge base for storing and retrieving document chunks using embeddings.
     """
     
-    def __init__(self, embedding_model: str = 'all-MiniLM-L6-v2'):
+    # HNSW graph settings: neighbors per node and build-time search width
+    HNSW_M = 32
+    HNSW_EF_CONSTRUCTION = 200
+    
+    # With index_type='auto', knowledge bases with more chunks than this use HNSW
+    HNSW_MIN_CHUNKS = 10_000
+    
+    # Exhaustive indexes with at least this many vectors are split into one
+    # shard per CPU core, so a single query is scanned by all cores
+    SHARD_MIN_CHUNKS = 20_000
+    
+    # Default texts per encode batch; encode() sorts texts by length so batches
+    # pad tightly, and a GPU stays busy with larger batches
+    DEFAULT_BATCH_SIZES = {'cuda': 128, 'cpu': 64}
+    
+    # Number of recent query embeddings kept, so repeated questions skip the model
+    QUERY_CACHE_SIZE = 1024
+    
+    def __init__(self, embedding_model: str = 'all-MiniLM-L6-v2',
+                 index_type: str = 'auto', hnsw_ef_search: int = 64,
+                 backend: str = 'torch', model_file_name: Optional[str] = None,
+                 embedding_cache: Optional[Dict[str, np.ndarray]] = None):
         """
         Initialize the knowledge base.
         
         Args:
             embedding_model: Name of the sentence transformer model
+            index_type: 'flat' for exact search, 'hnsw' for approximate graph
+                search that stays fast on large knowledge bases, or 'auto' to
+                use HNSW above HNSW_MIN_CHUNKS chunks (default: 'auto')
+            hnsw_ef_search: Search width for HNSW indexes; higher is more
+                accurate and slower (default: 64)
+            backend: Inference backend for the embedding model: 'torch',
+                'onnx' or 'openvino'; the latter two need the matching
+                sentence-transformers extra installed (default: 'torch')
+            model_file_name: Model file to load for the onnx/openvino backend,
+                e.g. 'onnx/model_qint8_avx512_vnni.onnx' for an int8 model
+                (optional; the fp32 export by default)
+            embedding_cache: Model and chunk text hash -> embedding mapping to
+                reuse and fill, e.g. an EmbeddingCache shared between rebuilds
+                (optional; a new empty cache by default)
         """
+        import torch
+        
+        if index_type not in ('auto', 'flat', 'hnsw'):
+            raise ValueError(f"Unsupported index type: {index_type}")
+        
         self.embedding_model_name = embedding_model
+        self.index_type = index_type
+        self.hnsw_ef_search = hnsw_ef_search
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.backend = backend
+        self.model_file_name = model_file_name
+        self.embedding_cache = embedding_cache if embedding_cache is not None else {}
+        
+        # Set while the index lives on a GPU; the resources must outlive the index
+        self._gpu_resources = None
+        
+        # Sub-indexes of a sharded index; IndexShards doesn't own them
+        self._shards = []
+        
         self.model = None
         self.index = None
         self.chunks = []
@@ -40,12 +308,13 @@ class KnowledgeBase:
     def _load_model(self):
         """Load the sentence transformer model."""
         try:
-            logger.info(f"Loading embedding model: {self.embedding_model_name}")
-            self.model = SentenceTransformer(self.embedding_model_name)
+            logger.info(f"Loading embedding model: {self.embedding_model_name} on {self.device}")
+            self.model, self.backend, self.dimension = load_embedding_model(
+                self.embedding_model_name, self.device, self.backend, self.model_file_name
+            )
             
-            # Get embedding dimension
-            test_embedding = self.model.encode(["test"])
-            self.dimension = test_embedding.shape[1]
+            # Fresh query cache for this model
+            self._cached_query_embedding = lru_cache(maxsize=self.QUERY_CACHE_SIZE)(self._encode_query)
             logger.info(f"Model loaded. Embedding dimension: {self.dimension}")
             
         except Exception as e:
@@ -69,36 +338,33 @@ class KnowledgeBase:
         if not text:
             return []
         
-        # Initialize text splitter
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
-        
-        # Split text
-        chunks = text_splitter.split_text(text)
-        
-        # Create chunk dictionaries with metadata
-        chunk_dicts = []
-        for i, chunk in enumerate(chunks):
-            chunk_dict = {
-                'text': chunk,
-                'chunk_index': i,
-                'total_chunks': len(chunks),
-                **metadata
-            }
-            chunk_dicts.append(chunk_dict)
-        
-        return chunk_dicts
+        return self._make_chunk_dicts(split_text(text, chunk_size, chunk_overlap), metadata)
+    
+    def _make_chunk_dicts(self, chunks: List[str], metadata: Dict) -> List[Dict]:
+        """Attach chunk positions and page metadata to the chunk texts of one page."""
+        # The metadata values (URL and title strings) are shared by all chunks
+        # of the page rather than copied
+        total_chunks = len(chunks)
+        return [
+            {'text': chunk, 'chunk_index': i, 'total_chunks': total_chunks, **metadata}
+            for i, chunk in enumerate(chunks)
+        ]
     
-    def create_embeddings(self, texts: List[str]) -> np.ndarray:
+    def _embedding_key(self, text: str) -> str:
+        """Key of a chunk text in the embedding cache; one cache can hold several models' embeddings."""
+        return hashlib.blake2b(f"{self.embedding_model_name}\0{text}".encode('utf-8'), digest_size=16).hexdigest()
+    
+    def create_embeddings(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
         """
         Create embeddings for list of texts.
         
+        Embeddings are looked up in the embedding cache by a hash of the text,
+        so only texts not seen before are encoded.
+        
         Args:
             texts: List of text strings
+            batch_size: Number of texts encoded per model call (default:
+                DEFAULT_BATCH_SIZES for the device)
             
         Returns:
             NumPy array of embeddings
@@ -107,12 +373,36 @@ class KnowledgeBase:
             return np.array([])
         
         try:
-            logger.info(f"Creating embeddings for {len(texts)} texts...")
-            embeddings = self.model.encode(
-                texts,
-                show_progress_bar=True,
-                batch_size=32
-            )
+            keys = [self._embedding_key(text) for text in texts]
+            
+            # Encode each distinct uncached text once. Cached embeddings are
+            # taken out up front, since a bounded cache may evict them meanwhile
+            found = {}
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key in found or key in missing:
+                    continue
+                try:
+                    found[key] = self.embedding_cache[key]
+                except KeyError:
+                    missing[key] = text
+            
+            logger.info(f"Creating embeddings for {len(missing)} texts "
+                        f"({len(texts) - len(missing)} reused from cache)...")
+            if missing:
+                # Batches stay on the device (and are normalized there) and are copied
+                # to the host once, instead of a synchronizing copy after every batch
+                new_embeddings = self.model.encode(
+                    list(missing.values()),
+                    show_progress_bar=True,
+                    batch_size=batch_size or self.DEFAULT_BATCH_SIZES.get(self.device, 32),
+                    convert_to_tensor=True,
+                    normalize_embeddings=True
+                ).float().cpu().numpy()
+                for key, embedding in zip(missing, new_embeddings):
+                    found[key] = self.embedding_cache[key] = embedding.astype('float32')
+            
+            embeddings = np.stack([found[key] for key in keys])
             logger.info(f"Created embeddings with shape: {embeddings.shape}")
             return embeddings
             
@@ -120,14 +410,22 @@ class KnowledgeBase:
             logger.error(f"Error creating embeddings: {str(e)}")
             raise
     
-    def build_vector_store(self, chunks: List[Dict], embeddings: np.ndarray):
+    def build_vector_store(self, chunks: List[Dict], embeddings: np.ndarray,
+                           dtype: str = 'float16'):
         """
         Build FAISS vector store from chunks and embeddings.
         
         Args:
             chunks: List of chunk dictionaries
-            embeddings: NumPy array of embeddings
+            embeddings: NumPy array of embeddings (normalized in place if
+                already contiguous float32)
+            dtype: Storage type of vectors in the index, 'float16' (default;
+                half the memory traffic per search, near-identical rankings)
+                or 'float32'
         """
+        if dtype not in ('float32', 'float16'):
+            raise ValueError(f"Unsupported index dtype: {dtype}")
+        
         if len(chunks) != len(embeddings):
             raise ValueError("Number of chunks must match number of embeddings")
         
@@ -141,19 +439,45 @@ class KnowledgeBase:
         self.chunk_metadata = chunks
         
         # Create FAISS index
-        # Using IndexFlatL2 for exact search (cosine similarity via L2 on normalized vectors)
-        self.index = faiss.IndexFlatL2(self.dimension)
-        
-        # Normalize embeddings for cosine similarity
-        embeddings_normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        # Using inner product search (cosine similarity on normalized vectors), either
+        # exhaustive or over an HNSW graph, with vectors stored as fp16 by the scalar
+        # quantizer when requested
+        use_hnsw = self.index_type == 'hnsw' or (
+            self.index_type == 'auto' and len(chunks) > self.HNSW_MIN_CHUNKS
+        )
+        if use_hnsw and dtype == 'float16':
+            self.index = faiss.IndexHNSWSQ(self.dimension, faiss.ScalarQuantizer.QT_fp16,
+                                           self.HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        elif use_hnsw:
+            self.index = faiss.IndexHNSWFlat(self.dimension, self.HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        elif dtype == 'float16':
+            self.index = faiss.IndexScalarQuantizer(self.dimension, faiss.ScalarQuantizer.QT_fp16,
+                                                    faiss.METRIC_INNER_PRODUCT)
+        else:
+            self.index = faiss.IndexFlatIP(self.dimension)
+        
+        if use_hnsw:
+            self.index.hnsw.efConstruction = self.HNSW_EF_CONSTRUCTION
+            self.index.hnsw.efSearch = self.hnsw_ef_search
+        
+        # Normalize embeddings in place for cosine similarity
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        faiss.normalize_L2(embeddings)
         
         # Add to index
-        self.index.add(embeddings_normalized.astype('float32'))
+        self._gpu_resources = None
+        self._shards = []
+        if not self.index.is_trained:
+            self.index.train(embeddings)
+        self.index.add(embeddings)
+        self._move_index_to_gpu()
+        self._shard_index()
         
         logger.info(f"FAISS index built successfully. Total vectors: {self.index.ntotal}")
     
     def build_from_crawled_data(self, crawled_pages: List[Dict],
-                                 chunk_size: int = 1000, chunk_overlap: int = 200):
+                                 chunk_size: int = 1000, chunk_overlap: int = 200,
+                                 batch_size: Optional[int] = None, dtype: str = 'float16'):
         """
         Build knowledge base from crawled page data.
         
@@ -161,6 +485,9 @@ class KnowledgeBase:
             crawled_pages: List of crawled page dictionaries
             chunk_size: Size of each chunk
             chunk_overlap: Overlap between chunks
+            batch_size: Number of chunks encoded per model call (default:
+                DEFAULT_BATCH_SIZES for the device)
+            dtype: Storage type of vectors in the index, 'float16' or 'float32'
         """
         if not crawled_pages:
             raise ValueError("No crawled pages provided")
@@ -169,37 +496,66 @@ class KnowledgeBase:
         
         all_chunks = []
         
-        # Process each page
+        # Split the text of each page. This stays in-process: a default-sized
+        # site splits in tens of milliseconds, less than starting worker processes
         for page in crawled_pages:
+            if not page.get('text'):
+                continue
+            
+            chunks = split_text(page['text'], chunk_size, chunk_overlap)
+            
             # Prepare metadata
             metadata = {
                 'url': page.get('url', ''),
                 'title': page.get('title', ''),
                 'depth': page.get('depth', 0)
             }
-            
-            # Chunk the text
-            text = page.get('text', '')
-            if text:
-                chunks = self.chunk_text(text, metadata, chunk_size, chunk_overlap)
-                all_chunks.extend(chunks)
+            all_chunks.extend(self._make_chunk_dicts(chunks, metadata))
         
         if not all_chunks:
             raise ValueError("No text chunks created from crawled pages")
         
+        # Keep only the first occurrence of repeated chunks (navigation, footers
+        # and other boilerplate), which would otherwise crowd out search results
+        unique_chunks = {}
+        for chunk in all_chunks:
+            unique_chunks.setdefault(chunk['text'], chunk)
+        if len(unique_chunks) < len(all_chunks):
+            logger.info(f"Dropped {len(all_chunks) - len(unique_chunks)} duplicate chunks")
+            all_chunks = list(unique_chunks.values())
+        
         logger.info(f"Created {len(all_chunks)} chunks from {len(crawled_pages)} pages")
         
         # Extract text from chunks
         chunk_texts = [chunk['text'] for chunk in all_chunks]
         
         # Create embeddings
-        embeddings = self.create_embeddings(chunk_texts)
+        embeddings = self.create_embeddings(chunk_texts, batch_size=batch_size)
         
         # Build vector store
-        self.build_vector_store(all_chunks, embeddings)
+        self.build_vector_store(all_chunks, embeddings, dtype=dtype)
         
         logger.info("Knowledge base built successfully")
     
+    def _encode_query(self, query: str) -> np.ndarray:
+        """Encode and L2-normalize a query; the result is read-only because it is cached."""
+        query_embedding = np.ascontiguousarray(self.model.encode([query]), dtype='float32')
+        faiss.normalize_L2(query_embedding)
+        query_embedding.flags.writeable = False
+        return query_embedding
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        Get the normalized embedding of a query, reusing recent results.
+        
+        Args:
+            query: Search query
+            
+        Returns:
+            Read-only float32 array of shape (1, dimension)
+        """
+        return self._cached_query_embedding(query)
+    
     def search(self, query: str, top_k: int = 5) -> List[Dict]:
         """
         Search for relevant chunks using semantic similarity.
@@ -215,23 +571,69 @@ class KnowledgeBase:
             logger.warning("Knowledge base not initialized")
             return []
         
-        # Create query embedding
-        query_embedding = self.model.encode([query])
+        # Create normalized query embedding (cached for repeated queries)
+        query_embedding = self.embed_query(query)
         
-        # Normalize for cosine similarity
-        query_embedding_normalized = query_embedding / np.linalg.norm(query_embedding, axis=1, keepdims=True)
+        # Search
+        top_k = min(top_k, len(self.chunks))
+        distances, indices = self.index.search(query_embedding, top_k)
+        
+        return self._format_results(distances[0], indices[0])
+    
+    def search_batch(self, queries: List[str], top_k: int = 5) -> List[List[Dict]]:
+        """
+        Search for several queries with one model call and one index search.
+        
+        FAISS parallelizes across the queries of a batch, so this is faster
+        than calling search() once per query.
+        
+        Args:
+            queries: Search queries
+            top_k: Number of top results to return per query
+            
+        Returns:
+            One list of relevant chunk dictionaries per query, in query order
+        """
+        if not self.index or not self.chunks:
+            logger.warning("Knowledge base not initialized")
+            return [[] for _ in queries]
+        
+        if not queries:
+            return []
+        
+        # Create normalized query embeddings as one (num_queries, dimension) matrix
+        query_embeddings = np.ascontiguousarray(self.model.encode(queries), dtype='float32')
+        faiss.normalize_L2(query_embeddings)
         
         # Search
         top_k = min(top_k, len(self.chunks))
-        distances, indices = self.index.search(query_embedding_normalized.astype('float32'), top_k)
+        distances, indices = self.index.search(query_embeddings, top_k)
+        
+        return [self._format_results(row_distances, row_indices)
+                for row_distances, row_indices in zip(distances, indices)]
+    
+    def _format_results(self, distances: np.ndarray, indices: np.ndarray) -> List[Dict]:
+        """
+        Turn one row of FAISS search output into result dictionaries.
+        
+        Args:
+            distances: Scores for one query
+            indices: Chunk positions for one query (-1 where FAISS found fewer results)
+            
+        Returns:
+            List of chunk dictionaries with similarity scores and ranks
+        """
+        # Inner product scores are cosine similarities already; indexes saved
+        # before the switch from L2 still return distances
+        is_l2 = self.index.metric_type == faiss.METRIC_L2
         
-        # Format results
         results = []
-        for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-            if idx < len(self.chunk_metadata):
+        for i, (distance, idx) in enumerate(zip(distances, indices)):
+            if 0 <= idx < len(self.chunk_metadata):
                 result = {
+                    'text': self.chunks[idx],
                     **self.chunk_metadata[idx],
-                    'similarity_score': float(1 - distance),  # Convert distance to similarity
+                    'similarity_score': float(1 - distance) if is_l2 else float(distance),
                     'rank': i + 1
                 }
                 results.append(result)
@@ -249,19 +651,46 @@ class KnowledgeBase:
         
         logger.info(f"Saving knowledge base to {directory}")
         
-        # Save FAISS index
+        # Save FAISS index (GPU indexes are copied back to the CPU first, and
+        # shards, which FAISS can't serialize, are merged back into one index)
         index_path = os.path.join(directory, 'faiss_index.index')
-        faiss.write_index(self.index, index_path)
-        
-        # Save metadata
-        metadata_path = os.path.join(directory, 'metadata.pkl')
-        with open(metadata_path, 'wb') as f:
-            pickle.dump({
-                'chunks': self.chunks,
-                'chunk_metadata': self.chunk_metadata,
+        cpu_index = self.index
+        if self._gpu_resources:
+            cpu_index = faiss.index_gpu_to_cpu(self.index)
+        elif self._shards:
+            cpu_index = faiss.clone_index(self._shards[0])
+            for shard in self._shards[1:]:
+                cpu_index.add(shard.reconstruct_n(0, shard.ntotal))
+        faiss.write_index(cpu_index, index_path)
+        
+        # Save chunk texts as one blob (memory-mapped on load) and the rest of
+        # the metadata as JSON lines
+        offsets = ChunkTexts.write(os.path.join(directory, 'chunks.bin'), self.chunks)
+        np.save(os.path.join(directory, 'chunk_offsets.npy'), offsets)
+        
+        with open(os.path.join(directory, 'metadata.jsonl'), 'wb') as f:
+            for metadata in self.chunk_metadata:
+                f.write(orjson.dumps({key: value for key, value in metadata.items() if key != 'text'}))
+                f.write(b'\n')
+        
+        with open(os.path.join(directory, 'kb_info.json'), 'wb') as f:
+            f.write(orjson.dumps({
                 'embedding_model_name': self.embedding_model_name,
                 'dimension': self.dimension
-            }, f)
+            }))
+        
+        # Save the embeddings of this knowledge base's chunks, so rebuilds can skip
+        # unchanged chunks (the cache may be shared with other knowledge bases)
+        keys = [self._embedding_key(text) for text in self.chunks]
+        if isinstance(self.embedding_cache, EmbeddingCache):
+            embeddings = self.embedding_cache.snapshot(keys)
+        else:
+            embeddings = {key: self.embedding_cache[key] for key in keys if key in self.embedding_cache}
+        if embeddings:
+            cache_path = os.path.join(directory, 'embedding_cache.npz')
+            np.savez(cache_path,
+                     keys=np.array(list(embeddings.keys())),
+                     embeddings=np.stack(list(embeddings.values())))
         
         logger.info("Knowledge base saved successfully")
     
@@ -277,22 +706,115 @@ class KnowledgeBase:
         # Load FAISS index
         index_path = os.path.join(directory, 'faiss_index.index')
         self.index = faiss.read_index(index_path)
-        
-        # Load metadata
-        metadata_path = os.path.join(directory, 'metadata.pkl')
-        with open(metadata_path, 'rb') as f:
-            data = pickle.load(f)
+        self._gpu_resources = None
+        self._shards = []
+        if hasattr(self.index, 'hnsw'):
+            self.index.hnsw.efSearch = self.hnsw_ef_search
+        self._move_index_to_gpu()
+        self._shard_index()
+        
+        # Load metadata; knowledge bases saved before the switch to
+        # memory-mapped texts keep everything in one pickle
+        info_path = os.path.join(directory, 'kb_info.json')
+        if os.path.exists(info_path):
+            with open(info_path, 'rb') as f:
+                data = orjson.loads(f.read())
+            
+            offsets = np.load(os.path.join(directory, 'chunk_offsets.npy'))
+            self.chunks = ChunkTexts(os.path.join(directory, 'chunks.bin'), offsets)
+            # Chunks of a page repeat its URL and title; share one string
+            # object per distinct value instead of one per chunk
+            shared_values = {}
+            with open(os.path.join(directory, 'metadata.jsonl'), 'rb') as f:
+                self.chunk_metadata = [
+                    {key: shared_values.setdefault(value, value) if isinstance(value, str) else value
+                     for key, value in orjson.loads(line).items()}
+                    for line in f
+                ]
+        else:
+            with open(os.path.join(directory, 'metadata.pkl'), 'rb') as f:
+                data = pickle.load(f)
             self.chunks = data['chunks']
             self.chunk_metadata = data['chunk_metadata']
-            self.dimension = data['dimension']
-            
-            # Reload model if different
-            if data['embedding_model_name'] != self.embedding_model_name:
-                self.embedding_model_name = data['embedding_model_name']
-                self._load_model()
+        
+        self.dimension = data['dimension']
+        
+        # Reload model if different (cached embeddings are keyed by model, so the
+        # old model's entries are simply not found)
+        if data['embedding_model_name'] != self.embedding_model_name:
+            self.embedding_model_name = data['embedding_model_name']
+            self._load_model()
+        
+        # Load embedding cache if it was saved
+        cache_path = os.path.join(directory, 'embedding_cache.npz')
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cache:
+                self.embedding_cache.update(zip(cache['keys'].tolist(), cache['embeddings']))
         
         logger.info(f"Knowledge base loaded successfully. {len(self.chunks)} chunks available")
     
+    def _move_index_to_gpu(self):
+        """Move the index to the first GPU when FAISS has GPU support and one is available."""
+        if not hasattr(faiss, 'StandardGpuResources') or faiss.get_num_gpus() == 0:
+            return
+        
+        try:
+            resources = faiss.StandardGpuResources()
+            self.index = faiss.index_cpu_to_gpu(resources, 0, self.index)
+            self._gpu_resources = resources
+            logger.info("FAISS index moved to GPU")
+        except Exception as e:
+            # Not every index type has a GPU implementation (e.g. HNSW)
+            logger.warning(f"Keeping FAISS index on CPU: {str(e)}")
+    
+    def _shard_index(self):
+        """
+        Split a large exhaustive index into one shard per CPU core.
+        
+        FAISS parallelizes a flat index only across the queries of a batch;
+        shards are searched in parallel threads, so one query uses every
+        core. Shard ids are successive, so results still address
+        chunk_metadata.
+        """
+        num_shards = os.cpu_count() or 1
+        is_exhaustive = isinstance(self.index, (faiss.IndexFlat, faiss.IndexScalarQuantizer))
+        if (num_shards < 2 or self._gpu_resources or not is_exhaustive
+                or self.index.metric_type != faiss.METRIC_INNER_PRODUCT
+                or self.index.ntotal < self.SHARD_MIN_CHUNKS):
+            return
+        
+        sharded_index = faiss.IndexShards(self.dimension, True, True)  # threaded, successive ids
+        bounds = np.linspace(0, self.index.ntotal, num_shards + 1, dtype=int)
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if isinstance(self.index, faiss.IndexScalarQuantizer):
+                shard = faiss.IndexScalarQuantizer(self.dimension, self.index.sq.qtype,
+                                                   faiss.METRIC_INNER_PRODUCT)
+            else:
+                shard = faiss.IndexFlatIP(self.dimension)
+            shard.add(self.index.reconstruct_n(int(start), int(end - start)))
+            sharded_index.add_shard(shard)
+            self._shards.append(shard)
+        
+        self.index = sharded_index
+        logger.info(f"FAISS index split into {num_shards} shards")
+    
+    def _index_bytes(self) -> int:
+        """Approximate memory used by the FAISS index (vectors plus any HNSW graph links)."""
+        if not self.index:
+            return 0
+        
+        if self._gpu_resources:
+            return self.index.ntotal * self.dimension * 4
+        
+        if self._shards:
+            return sum(shard.ntotal * shard.code_size for shard in self._shards)
+        
+        if hasattr(self.index, 'hnsw'):
+            storage = faiss.downcast_index(self.index.storage)
+            return self.index.ntotal * storage.code_size + self.index.hnsw.neighbors.size() * 4
+        
+        return self.index.ntotal * self.index.code_size
+    
     def get_stats(self) -> Dict:
         """
         Get knowledge base statistics.
@@ -304,7 +826,8 @@ class KnowledgeBase:
             return {
                 'total_chunks': 0,
                 'total_vectors': 0,
-                'embedding_dimension': self.dimension or 0
+                'embedding_dimension': self.dimension or 0,
+                'index_bytes': 0
             }
         
         unique_urls = set(metadata.get('url', '') for metadata in self.chunk_metadata)
@@ -313,6 +836,10 @@ class KnowledgeBase:
             'total_chunks': len(self.chunks),
             'total_vectors': self.index.ntotal if self.index else 0,
             'embedding_dimension': self.dimension,
+            'index_bytes': self._index_bytes(),
+            'index_type': type(self.index).__name__ if self.index else None,
+            'device': self.device,
+            'backend': self.backend,
             'unique_sources': len(unique_urls),
             'model_name': self.embedding_model_name
         }
@@ -3,7 +3,10 @@ RAG pipeline for question answering using retrieved context.
 """
 
 import logging
-from typing import List, Dict, Optional
+import threading
+from typing import List, Dict, Iterator, Optional
+import numpy as np
+import faiss
 from groq import Groq
 import google.generativeai as genai
 from src.knowledge_base import KnowledgeBase
@@ -16,6 +19,21 @@ class RAGPipeline:
     RAG pipeline that retrieves context and generates answers using LLM.
     """
     
+    # Answers to standalone questions are reused for near-identical questions
+    ANSWER_CACHE_SIZE = 256
+    ANSWER_CACHE_MIN_SIMILARITY = 0.97
+    
+    # Static instructions, sent ahead of the per-question prompt so every
+    # request starts with the same prefix and hits the provider's prompt cache
+    SYSTEM_PROMPT = """You are a helpful AI assistant that answers questions based on the provided context from a website.
+
+Instructions:
+1. Answer the question based ONLY on the information provided in the context
+2. If the context doesn't contain enough information to answer the question, say so clearly
+3. Be specific and cite which source(s) you're using when relevant
+4. Keep your answer concise but complete
+5. Use a friendly, conversational tone"""
+    
     def __init__(self, knowledge_base: KnowledgeBase, groq_api_key: str, 
                  google_api_key: Optional[str] = None):
         """
@@ -30,6 +48,12 @@ class RAGPipeline:
         self.groq_api_key = groq_api_key
         self.google_api_key = google_api_key
         
+        # Embeddings of answered questions (inner product index) and their responses;
+        # the pipeline can be shared between sessions, so access is locked
+        self._answer_cache_index = None
+        self._answer_cache: List[Dict] = []
+        self._answer_cache_lock = threading.Lock()
+        
         # Initialize Groq client
         self.groq_client = None
         if groq_api_key:
@@ -68,11 +92,29 @@ class RAGPipeline:
         
         return results
     
+    def retrieve_context_batch(self, questions: List[str], top_k: int = 5) -> List[List[Dict]]:
+        """
+        Retrieve relevant context chunks for several questions at once.
+        
+        Args:
+            questions: User questions
+            top_k: Number of chunks to retrieve per question
+            
+        Returns:
+            One list of relevant chunk dictionaries per question
+        """
+        logger.info(f"Retrieving context for {len(questions)} questions...")
+        
+        return self.knowledge_base.search_batch(questions, top_k=top_k)
+    
     def construct_prompt(self, question: str, context: List[Dict], 
                         history: Optional[List] = None) -> str:
         """
         Construct prompt for LLM with context and chat history.
         
+        The instructions are not part of the prompt; they are sent
+        separately as SYSTEM_PROMPT.
+        
         Args:
             question: User question
             context: Retrieved context chunks
@@ -97,25 +139,45 @@ class RAGPipeline:
                 history_text += f"{role.capitalize()}: {content}\n"
         
         # Construct final prompt
-        prompt = f"""You are a helpful AI assistant that answers questions based on the provided context from a website.
-
-Context from website:
+        prompt = f"""Context from website:
 {context_text}
 {history_text}
 
 User Question: {question}
 
-Instructions:
-1. Answer the question based ONLY on the information provided in the context above
-2. If the context doesn't contain enough information to answer the question, say so clearly
-3. Be specific and cite which source(s) you're using when relevant
-4. Keep your answer concise but complete
-5. Use a friendly, conversational tone
-
 Answer:"""
         
         return prompt
     
+    def _create_groq_completion(self, prompt: str, stream: bool = False):
+        """
+        Send a chat completion request to Groq.
+        
+        Args:
+            prompt: Prompt for LLM
+            stream: Whether to stream the response
+            
+        Returns:
+            Groq completion, or a chunk iterator when streaming
+        """
+        return self.groq_client.chat.completions.create(
+            messages=[
+                {
+                    "role": "system",
+                    "content": self.SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            model="llama-3.1-70b-versatile",
+            temperature=0.7,
+            max_tokens=1024,
+            top_p=0.9,
+            stream=stream
+        )
+    
     def generate_answer_groq(self, prompt: str) -> str:
         """
         Generate answer using Groq API.
@@ -129,18 +191,7 @@ Answer:"""
         try:
             logger.info("Generating answer with Groq...")
             
-            response = self.groq_client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                model="llama-3.1-70b-versatile",
-                temperature=0.7,
-                max_tokens=1024,
-                top_p=0.9
-            )
+            response = self._create_groq_completion(prompt)
             
             answer = response.choices[0].message.content
             logger.info("Answer generated successfully with Groq")
@@ -151,6 +202,10 @@ Answer:"""
             logger.error(f"Error generating answer with Groq: {str(e)}")
             raise
     
+    def _gemini_prompt(self, prompt: str) -> str:
+        """Prefix a prompt with the instructions (gemini-pro takes no system instruction)."""
+        return f"{self.SYSTEM_PROMPT}\n\n{prompt}"
+    
     def generate_answer_gemini(self, prompt: str) -> str:
         """
         Generate answer using Google Gemini API.
@@ -164,7 +219,7 @@ Answer:"""
         try:
             logger.info("Generating answer with Gemini...")
             
-            response = self.gemini_model.generate_content(prompt)
+            response = self.gemini_model.generate_content(self._gemini_prompt(prompt))
             answer = response.text
             
             logger.info("Answer generated successfully with Gemini")
@@ -202,18 +257,60 @@ Answer:"""
         
         raise Exception("No LLM API available. Please provide valid API keys.")
     
-    def format_response(self, answer: str, sources: List[Dict]) -> Dict:
+    def generate_answer_stream(self, prompt: str) -> Iterator[str]:
         """
-        Format the final response with answer and sources.
+        Stream answer text using available LLM (Groq with Gemini fallback).
+        
+        Falls back to Gemini only if the Groq request fails before any text
+        has been produced.
+        
+        Args:
+            prompt: Prompt for LLM
+            
+        Yields:
+            Pieces of the generated answer
+        """
+        # Try Groq first
+        if self.groq_client:
+            try:
+                logger.info("Streaming answer with Groq...")
+                stream = self._create_groq_completion(prompt, stream=True)
+            except Exception as e:
+                logger.warning(f"Groq failed, trying Gemini fallback: {str(e)}")
+            else:
+                for chunk in stream:
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+                logger.info("Answer streamed successfully with Groq")
+                return
+        
+        # Fallback to Gemini
+        if self.gemini_model:
+            try:
+                logger.info("Streaming answer with Gemini...")
+                stream = self.gemini_model.generate_content(self._gemini_prompt(prompt), stream=True)
+            except Exception as e:
+                logger.error(f"Gemini also failed: {str(e)}")
+                raise Exception("Both Groq and Gemini APIs failed")
+            for chunk in stream:
+                if chunk.text:
+                    yield chunk.text
+            logger.info("Answer streamed successfully with Gemini")
+            return
+        
+        raise Exception("No LLM API available. Please provide valid API keys.")
+    
+    def extract_sources(self, sources: List[Dict]) -> List[Dict]:
+        """
+        Collapse retrieved chunks into a list of unique source pages.
         
         Args:
-            answer: Generated answer
             sources: Source chunks used
             
         Returns:
-            Formatted response dictionary
+            List of source dictionaries, one per URL
         """
-        # Extract unique sources
         unique_sources = []
         seen_urls = set()
         
@@ -227,12 +324,71 @@ Answer:"""
                 })
                 seen_urls.add(url)
         
+        return unique_sources
+    
+    def format_response(self, answer: str, sources: List[Dict]) -> Dict:
+        """
+        Format the final response with answer and sources.
+        
+        Args:
+            answer: Generated answer
+            sources: Source chunks used
+            
+        Returns:
+            Formatted response dictionary
+        """
+        # Extract unique sources
+        unique_sources = self.extract_sources(sources)
+        
         return {
             'answer': answer,
             'sources': unique_sources,
             'num_sources': len(unique_sources)
         }
     
+    def _is_standalone(self, chat_history: Optional[List]) -> bool:
+        """A question is standalone (and its answer cacheable) when no answer precedes it."""
+        return not any(msg.get('role') == 'assistant' for msg in chat_history or [])
+    
+    def _lookup_cached_answer(self, query_embedding: np.ndarray) -> Optional[Dict]:
+        """
+        Find the response to a previously answered, near-identical question.
+        
+        Args:
+            query_embedding: Normalized question embedding
+            
+        Returns:
+            Copy of the cached response, or None on a miss
+        """
+        with self._answer_cache_lock:
+            if self._answer_cache_index is None or self._answer_cache_index.ntotal == 0:
+                return None
+            
+            scores, ids = self._answer_cache_index.search(query_embedding, 1)
+            if scores[0][0] < self.ANSWER_CACHE_MIN_SIMILARITY:
+                return None
+            
+            return dict(self._answer_cache[ids[0][0]])
+    
+    def _cache_answer(self, query_embedding: np.ndarray, response: Dict):
+        """
+        Remember the response to a question, evicting the oldest one when full.
+        
+        Args:
+            query_embedding: Normalized question embedding
+            response: Response from format_response()
+        """
+        with self._answer_cache_lock:
+            if self._answer_cache_index is None:
+                self._answer_cache_index = faiss.IndexFlatIP(query_embedding.shape[1])
+            
+            if self._answer_cache_index.ntotal >= self.ANSWER_CACHE_SIZE:
+                self._answer_cache_index.remove_ids(np.array([0], dtype='int64'))
+                self._answer_cache.pop(0)
+            
+            self._answer_cache_index.add(query_embedding)
+            self._answer_cache.append(response)
+    
     def answer_question(self, question: str, chat_history: Optional[List] = None,
                        top_k: int = 5) -> Dict:
         """
@@ -249,6 +405,15 @@ Answer:"""
         logger.info(f"Processing question: {question[:100]}...")
         
         try:
+            # Reuse the answer to a near-identical standalone question
+            query_embedding = None
+            if self._is_standalone(chat_history):
+                query_embedding = self.knowledge_base.embed_query(question)
+                cached_response = self._lookup_cached_answer(query_embedding)
+                if cached_response:
+                    logger.info("Question answered from cache")
+                    return cached_response
+            
             # Retrieve relevant context
             context = self.retrieve_context(question, top_k=top_k)
             
@@ -268,6 +433,9 @@ Answer:"""
             # Format response
             response = self.format_response(answer, context)
             
+            if query_embedding is not None:
+                self._cache_answer(query_embedding, response)
+            
             logger.info("Question answered successfully")
             
             return response
@@ -280,3 +448,80 @@ Answer:"""
                 'num_sources': 0,
                 'error': str(e)
             }
+    
+    def answer_question_stream(self, question: str, chat_history: Optional[List] = None,
+                               top_k: int = 5) -> Dict:
+        """
+        Answer a question using RAG pipeline, streaming the answer text.
+        
+        Retrieval runs immediately; generation starts when the returned
+        stream is consumed.
+        
+        Args:
+            question: User question
+            chat_history: Previous chat messages (optional)
+            top_k: Number of context chunks to retrieve
+            
+        Returns:
+            Dictionary with an 'answer_stream' iterator of text pieces and sources
+        """
+        logger.info(f"Processing question (streaming): {question[:100]}...")
+        
+        try:
+            # Reuse the answer to a near-identical standalone question
+            query_embedding = None
+            if self._is_standalone(chat_history):
+                query_embedding = self.knowledge_base.embed_query(question)
+                cached_response = self._lookup_cached_answer(query_embedding)
+                if cached_response:
+                    logger.info("Question answered from cache")
+                    return {
+                        'answer_stream': iter([cached_response['answer']]),
+                        'sources': cached_response['sources'],
+                        'num_sources': cached_response['num_sources']
+                    }
+            
+            # Retrieve relevant context
+            context = self.retrieve_context(question, top_k=top_k)
+        except Exception as e:
+            logger.error(f"Error answering question: {str(e)}")
+            return {
+                'answer_stream': iter([f"I encountered an error while processing your question: {str(e)}"]),
+                'sources': [],
+                'num_sources': 0,
+                'error': str(e)
+            }
+        
+        if not context:
+            return {
+                'answer_stream': iter(["I couldn't find any relevant information in the knowledge base to answer your question."]),
+                'sources': [],
+                'num_sources': 0
+            }
+        
+        # Construct prompt
+        prompt = self.construct_prompt(question, context, chat_history)
+        
+        def answer_stream() -> Iterator[str]:
+            pieces = []
+            try:
+                for piece in self.generate_answer_stream(prompt):
+                    pieces.append(piece)
+                    yield piece
+            except Exception as e:
+                logger.error(f"Error answering question: {str(e)}")
+                yield f"I encountered an error while processing your question: {str(e)}"
+                return
+            
+            # Only complete answers are cached
+            if query_embedding is not None:
+                self._cache_answer(query_embedding, self.format_response("".join(pieces), context))
+        
+        # Sources are known before generation starts
+        unique_sources = self.extract_sources(context)
+        
+        return {
+            'answer_stream': answer_stream(),
+            'sources': unique_sources,
+            'num_sources': len(unique_sources)
+        }
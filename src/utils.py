@@ -3,10 +3,11 @@ Utility functions for the RAG Website Chatbot.
 """
 
 import re
+import html
 import logging
+from functools import lru_cache
 from typing import Optional
-from urllib.parse import urlparse, urljoin, urlunparse
-import validators
+from urllib.parse import urlsplit, urljoin, urlunsplit
 
 
 # Configure logging
@@ -16,6 +17,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Compiled once; clean_text() runs for every heading and paragraph on every page.
+# Control characters that str.split() treats as whitespace (\x0b, \x0c,
+# \x1c-\x1f and \x85) are left in, so they separate words like any other space
+_CONTROL_CHARS_RE = re.compile(r'[\x00-\x08\x0e-\x1b\x7f-\x84\x86-\x9f]')
+
+# The ASCII part of the same set as a translation table. str.translate beats
+# the regex on ASCII text, but has a fixed cost that only pays off on longer strings
+_ASCII_CONTROL_CHARS = dict.fromkeys([*range(0x00, 0x09), *range(0x0e, 0x1c), 0x7f])
+_TRANSLATE_MIN_LENGTH = 256
+
+# Compiled once; is_valid_url() runs for every link found while crawling.
+# An http(s) URL without whitespace whose host is made of (Unicode) word
+# characters, dots and hyphens, or is a bracketed IPv6 literal
+_URL_RE = re.compile(
+    r'(?i:https?)://'
+    r'(?:[^\s/?#@\[\]]*@)?'
+    r'(?:[\w.-]+|\[[0-9A-Fa-f:.]+\])'
+    r'(?::(?P<port>\d*))?'
+    r'(?:[/?#]\S*)?'
+)
+MAX_URL_LENGTH = 2048
+
+# Query parameters that only track where a visitor came from; links that
+# differ only in these lead to the same page
+_TRACKING_PARAM_RE = re.compile(r'(?:utm_[^=]*|gclid|fbclid)(?:=|$)', re.IGNORECASE)
+
 
 def is_valid_url(url: str) -> bool:
     """
@@ -27,30 +54,60 @@ def is_valid_url(url: str) -> bool:
     Returns:
         True if URL is valid, False otherwise
     """
-    try:
-        if not url or not isinstance(url, str):
-            return False
-        
-        # Use validators library for comprehensive validation
-        result = validators.url(url)
-        if not result:
-            return False
-            
-        # Additional checks
-        parsed = urlparse(url)
-        if parsed.scheme not in ['http', 'https']:
-            return False
-            
-        return True
-    except Exception as e:
-        logger.error(f"Error validating URL {url}: {str(e)}")
+    if not url or not isinstance(url, str) or len(url) > MAX_URL_LENGTH:
+        return False
+    
+    match = _URL_RE.fullmatch(url)
+    if match is None:
         return False
+    
+    port = match.group('port')
+    return not port or int(port) <= 65535
+
+
+@lru_cache(maxsize=65536)
+def _canonicalize_url(url: str) -> Optional[str]:
+    """
+    Canonical form of an absolute URL, as described in normalize_url().
+    
+    Cached because the same navigation links resolve to the same absolute
+    URLs on every page of a site.
+    
+    Args:
+        url: Absolute URL
+        
+    Returns:
+        Canonical URL or None if invalid
+    """
+    # Parse URL
+    parsed = urlsplit(url)
+    
+    # Remove fragment, lowercase scheme and host (user info is case-sensitive)
+    userinfo, at, host = parsed.netloc.rpartition('@')
+    parsed = parsed._replace(scheme=parsed.scheme.lower(),
+                             netloc=userinfo + at + host.lower(),
+                             fragment='')
+    
+    # Drop tracking parameters and sort the rest, keeping their original encoding
+    if parsed.query:
+        params = [param for param in parsed.query.split('&')
+                  if param and not _TRACKING_PARAM_RE.match(param)]
+        parsed = parsed._replace(query='&'.join(sorted(params)))
+    
+    # Reconstruct URL
+    normalized = urlunsplit(parsed)
+    
+    return normalized if is_valid_url(normalized) else None
 
 
 def normalize_url(url: str, base_url: str = None) -> Optional[str]:
     """
     Normalize a URL by converting relative URLs to absolute and removing fragments.
     
+    The result is canonical, so equivalent links compare equal: the scheme
+    and host are lowercased, tracking parameters (utm_*, gclid, fbclid) are
+    dropped and the remaining query parameters are sorted.
+    
     Args:
         url: URL to normalize
         base_url: Base URL for resolving relative URLs
@@ -65,17 +122,8 @@ def normalize_url(url: str, base_url: str = None) -> Optional[str]:
         # Convert relative URLs to absolute
         if base_url:
             url = urljoin(base_url, url)
-            
-        # Parse URL
-        parsed = urlparse(url)
-        
-        # Remove fragment
-        parsed = parsed._replace(fragment='')
-        
-        # Reconstruct URL
-        normalized = urlunparse(parsed)
         
-        return normalized if is_valid_url(normalized) else None
+        return _canonicalize_url(url)
         
     except Exception as e:
         logger.error(f"Error normalizing URL {url}: {str(e)}")
@@ -96,21 +144,20 @@ def clean_text(text: str) -> str:
         return ""
     
     # Remove HTML entities
-    import html
     text = html.unescape(text)
     
-    # Replace multiple whitespace with single space
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Remove special control characters but keep basic punctuation
-    text = re.sub(r'[\x00-\x08\x0b-\x0c\x0e-\x1f\x7f-\x9f]', '', text)
-    
-    # Strip leading/trailing whitespace
-    text = text.strip()
+    # Remove special control characters
+    if len(text) >= _TRANSLATE_MIN_LENGTH and text.isascii():
+        text = text.translate(_ASCII_CONTROL_CHARS)
+    else:
+        text = _CONTROL_CHARS_RE.sub('', text)
     
-    return text
+    # Collapse whitespace to single spaces and strip the ends; str.split runs
+    # in C and matches the same characters as \s
+    return ' '.join(text.split())
 
 
+@lru_cache(maxsize=16384)
 def get_domain(url: str) -> Optional[str]:
     """
     Extract domain from URL.
@@ -122,7 +169,7 @@ def get_domain(url: str) -> Optional[str]:
         Domain string or None if invalid
     """
     try:
-        parsed = urlparse(url)
+        parsed = urlsplit(url)
         return parsed.netloc
     except Exception:
         return None
@@ -168,6 +215,24 @@ def format_time(seconds: float) -> str:
         return f"{hours:.1f}h"
 
 
+def format_bytes(num_bytes: int) -> str:
+    """
+    Format a byte count into a human-readable size string.
+    
+    Args:
+        num_bytes: Size in bytes
+        
+    Returns:
+        Formatted size string
+    """
+    if num_bytes < 1024:
+        return f"{num_bytes} B"
+    elif num_bytes < 1024 ** 2:
+        return f"{num_bytes / 1024:.1f} KB"
+    else:
+        return f"{num_bytes / 1024 ** 2:.1f} MB"
+
+
 def truncate_text(text: str, max_length: int = 100) -> str:
     """
     Truncate text to specified length with ellipsis.
@@ -2,9 +2,13 @@
 Unit tests for the web crawler module.
 """
 
+import os
+import asyncio
+import tempfile
+import multiprocessing
 import unittest
 from unittest.mock import Mock, patch, MagicMock
-from src.crawler import WebCrawler
+from src.crawler import WebCrawler, parse_html
 from src.utils import is_valid_url, normalize_url, clean_text
 
 
@@ -17,7 +21,9 @@ class TestURLValidation(unittest.TestCase):
             "https://www.example.com",
             "http://example.com",
             "https://example.com/path/to/page",
-            "https://example.com/path?query=value"
+            "https://example.com/path?query=value",
+            "HTTP://127.0.0.1:8080/",
+            "http://[::1]/page"
         ]
         
         for url in valid_urls:
@@ -30,6 +36,9 @@ class TestURLValidation(unittest.TestCase):
             "not a url",
             "ftp://example.com",
             "javascript:alert('xss')",
+            "https://example.com:99999/",
+            "https://example.com/a page",
+            "https://example.com/" + "a" * 2048,
             None
         ]
         
@@ -47,6 +56,27 @@ class TestURLValidation(unittest.TestCase):
         # Test fragment removal
         result = normalize_url("https://example.com/page#section")
         self.assertEqual(result, "https://example.com/page")
+        
+        # Test canonical host case and query order
+        result = normalize_url("HTTPS://Example.COM/Page?b=2&a=%2F")
+        self.assertEqual(result, "https://example.com/Page?a=%2F&b=2")
+        
+        # Test tracking parameter removal
+        result = normalize_url("https://example.com/page?utm_source=x&id=3&UTM_Medium=y&gclid=1&fbclid")
+        self.assertEqual(result, "https://example.com/page?id=3")
+        result = normalize_url("https://example.com/page?utm_source=x")
+        self.assertEqual(result, "https://example.com/page")
+    
+    def test_normalize_url_reuses_canonical_form_across_pages(self):
+        """Test that a nav link found on different pages is canonicalized once."""
+        from src.utils import _canonicalize_url
+        
+        _canonicalize_url.cache_clear()
+        for page in ("https://example.com/", "https://example.com/a", "https://example.com/b/"):
+            self.assertEqual(normalize_url("/about#team", page), "https://example.com/about")
+        
+        info = _canonicalize_url.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 2))
 
 
 class TestTextCleaning(unittest.TestCase):
@@ -64,6 +94,27 @@ class TestTextCleaning(unittest.TestCase):
         result = clean_text(text)
         self.assertEqual(result, "Hello world test")
         
+        # Test that removed control characters and decoded entities leave no double spaces
+        text = "  Hello \x07 &nbsp; world\u2003&#10;test  "
+        result = clean_text(text)
+        self.assertEqual(result, "Hello world test")
+        
+        # Test entities without a semicolon, numeric entities and that text is decoded only once
+        text = "AT&T &copy 2024 &#169; &amp;lt;b&amp;gt;"
+        result = clean_text(text)
+        self.assertEqual(result, "AT&T \u00a9 2024 \u00a9 &lt;b&gt;")
+        
+        # Test that control characters which are also whitespace separate words
+        text = "page\x0cbreak col\x1fsep\u2026 a\x85b\x07c"
+        result = clean_text(text)
+        self.assertEqual(result, "page break col sep\u2026 a bc")
+        
+        # Test long ASCII text, which takes the str.translate path
+        result = clean_text("Hello \x07 world\x7f!\t" * 50)
+        self.assertEqual(result, " ".join(["Hello world!"] * 50))
+        result = clean_text("page\x0cbreak\x0bcol\x1fsep\x1c" * 50)
+        self.assertEqual(result, " ".join(["page break col sep"] * 50))
+        
         # Test empty string
         result = clean_text("")
         self.assertEqual(result, "")
@@ -74,6 +125,12 @@ class TestWebCrawler(unittest.TestCase):
     
     def setUp(self):
         """Set up test fixtures."""
+        # Keep tests off the network (and independent, so they can run in
+        # parallel): every crawler created in a test finds no robots.txt
+        robots_patcher = patch('src.crawler.requests.Session.get', return_value=Mock(status_code=404))
+        robots_patcher.start()
+        self.addCleanup(robots_patcher.stop)
+        
         self.base_url = "https://example.com"
         self.crawler = WebCrawler(self.base_url, max_depth=2, max_pages=10)
     
@@ -91,6 +148,11 @@ class TestWebCrawler(unittest.TestCase):
             self.crawler.is_valid_url_for_crawling("https://example.com/page")
         )
         
+        # Host names compare case-insensitively with the base URL's
+        self.assertTrue(
+            self.crawler.is_valid_url_for_crawling("https://EXAMPLE.com/page")
+        )
+        
         # Different domain - should be invalid
         self.assertFalse(
             self.crawler.is_valid_url_for_crawling("https://other.com/page")
@@ -100,6 +162,17 @@ class TestWebCrawler(unittest.TestCase):
         self.assertFalse(
             self.crawler.is_valid_url_for_crawling("https://example.com/image.jpg")
         )
+        
+        # Extension check ignores case, query strings and path parameters
+        for url in ("https://example.com/IMAGE.JPG", "https://example.com/report.pdf?download=1",
+                    "https://example.com/report.pdf;jsessionid=1"):
+            self.assertFalse(self.crawler.is_valid_url_for_crawling(url), url)
+        
+        # Already queued - should be invalid
+        self.crawler.enqueued.add("https://example.com/queued")
+        self.assertFalse(
+            self.crawler.is_valid_url_for_crawling("https://example.com/queued")
+        )
     
     def test_extract_content(self):
         """Test content extraction from HTML."""
@@ -115,13 +188,55 @@ class TestWebCrawler(unittest.TestCase):
         </html>
         """
         
-        result = self.crawler.extract_content(html, self.base_url)
+        result = self.crawler.extract_content(parse_html(html), self.base_url)
         
         self.assertEqual(result['title'], "Test Page")
         self.assertIn("Main Heading", result['headings'])
         self.assertIn("paragraph", result['text'].lower())
         self.assertNotIn("console.log", result['text'])
     
+    def test_extract_content_visible_text_fallback(self):
+        """Test that pages without title, headings or paragraphs use all visible text."""
+        html = """
+        <html><body>
+            <span>Loose text outside any block element</span>
+            <script>console.log('ignore this');</script>
+        </body></html>
+        """
+        
+        result = self.crawler.extract_content(parse_html(html), self.base_url)
+        
+        self.assertEqual(result['text'], "Loose text outside any block element")
+        self.assertEqual(result['text_length'], len(result['text']))
+    
+    def test_extract_content_heading_order(self):
+        """Test that headings are collected in document order."""
+        html = """
+        <html><body>
+            <h2>Overview</h2>
+            <nav><h1>Site Menu</h1></nav>
+            <h1>Details</h1>
+            <h3>More</h3>
+        </body></html>
+        """
+        
+        result = self.crawler.extract_content(parse_html(html), self.base_url)
+        
+        self.assertEqual(result['headings'], ["Overview", "Details", "More"])
+    
+    def test_extract_content_xhtml(self):
+        """Test that pages with an XML declaration still parse."""
+        html = (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<html><head><title>XHTML Page</title></head>'
+            '<body><p>Caf\u00e9 content that is long enough.</p></body></html>'
+        )
+        
+        result = self.crawler.extract_content(parse_html(html), self.base_url)
+        
+        self.assertEqual(result['title'], "XHTML Page")
+        self.assertIn("Caf\u00e9", result['text'])
+    
     def test_get_links(self):
         """Test link extraction from HTML."""
         html = """
@@ -135,7 +250,7 @@ class TestWebCrawler(unittest.TestCase):
         </html>
         """
         
-        links = self.crawler.get_links(html, self.base_url)
+        links = self.crawler.get_links(parse_html(html), self.base_url)
         
         # Should include same-domain HTML pages only
         urls = [link for link in links]
@@ -144,6 +259,310 @@ class TestWebCrawler(unittest.TestCase):
         # Should not include external domain or images
         self.assertFalse(any("other.com" in url for url in urls))
         self.assertFalse(any(".jpg" in url for url in urls))
+    
+    def test_get_links_deduplicates_in_page_order(self):
+        """Test that links repeated on a page are returned once, in page order."""
+        html = """
+        <html>
+            <body>
+                <a href="/b">B</a>
+                <a href="/a#top">A</a>
+                <a>No target</a>
+                <a href="https://example.com/b">B again</a>
+                <a href="/a">A again</a>
+            </body>
+        </html>
+        """
+        
+        links = self.crawler.get_links(parse_html(html), self.base_url)
+        
+        self.assertEqual(links, ["https://example.com/b", "https://example.com/a"])
+    
+    def test_robots_crawl_delay(self):
+        """Test that Crawl-delay from robots.txt is honored."""
+        response = Mock(status_code=200, encoding='utf-8')
+        response.iter_content.return_value = [b"User-agent: *\nCrawl-delay: 2\nDisallow: /private"]
+        
+        with patch.object(self.crawler.session, 'get', return_value=response):
+            self.crawler._init_robots_parser()
+        
+        self.assertEqual(self.crawler._crawl_delay, 2.0)
+        self.assertFalse(self.crawler.is_allowed_by_robots("https://example.com/private"))
+    
+    def test_robots_server_error_disallows_all(self):
+        """Test that a 5xx on robots.txt stops the crawl rather than ignoring robots.txt."""
+        with patch.object(self.crawler.session, 'get', return_value=Mock(status_code=503)):
+            self.crawler._init_robots_parser()
+        
+        self.assertIsNotNone(self.crawler.robot_parser)
+        self.assertFalse(self.crawler.is_allowed_by_robots("https://example.com/"))
+        self.assertFalse(self.crawler.is_valid_url_for_crawling("https://example.com/page"))
+    
+    def test_robots_retries_exhausted_disallows_all(self):
+        """Test that robots.txt still applies when retries on server errors run out."""
+        import requests
+        
+        with patch.object(self.crawler.session, 'get',
+                          side_effect=requests.exceptions.RetryError("too many 503 error responses")):
+            self.crawler._init_robots_parser()
+        
+        self.assertIsNotNone(self.crawler.robot_parser)
+        self.assertFalse(self.crawler.is_allowed_by_robots("https://example.com/"))
+    
+    def test_robots_rules_match_robotparser(self):
+        """Test that compiled robots.txt rules agree with RobotFileParser."""
+        response = Mock(status_code=200, encoding='utf-8')
+        response.iter_content.return_value = [
+            b"User-agent: *\nAllow: /private/open\nDisallow: /private\nDisallow: /a%20b\nDisallow: /tmp/"
+        ]
+        
+        with patch.object(self.crawler.session, 'get', return_value=response):
+            self.crawler._init_robots_parser()
+        
+        for path in ["/", "/private", "/private/x", "/private/open/y", "/a b", "/tmp", "/tmp/x"]:
+            url = f"https://example.com{path}"
+            self.assertEqual(
+                self.crawler.is_allowed_by_robots(url),
+                self.crawler.robot_parser.can_fetch("*", url),
+                f"Mismatch for {path}"
+            )
+    
+    def test_adaptive_concurrency(self):
+        """Test additive increase and multiplicative decrease of concurrency."""
+        async def exercise():
+            self.crawler._slots_changed = asyncio.Condition()
+            start = self.crawler._concurrency
+            
+            await self.crawler._acquire_slot()
+            await self.crawler._release_slot(True)
+            self.assertEqual(self.crawler._concurrency, start + 1)
+            
+            await self.crawler._acquire_slot()
+            await self.crawler._release_slot(False)
+            self.assertEqual(self.crawler._concurrency, (start + 1) // 2)
+            
+            await self.crawler._acquire_slot()
+            await self.crawler._release_slot(None)
+            self.assertEqual(self.crawler._concurrency, (start + 1) // 2)
+            self.assertEqual(self.crawler._in_flight, 0)
+        
+        asyncio.run(exercise())
+    
+    def test_fetch_html_skips_non_html_and_oversized_pages(self):
+        """Test the content type check, the Content-Length check and the byte budget while reading."""
+        from aiohttp import web, ClientSession
+        from aiohttp.test_utils import TestServer
+        
+        body = b"<html><body>" + b"x" * 2000 + b"</body></html>"
+        
+        async def page(request):
+            return web.Response(body=b"<html><body>Hello</body></html>", content_type='text/html')
+        
+        async def image(request):
+            return web.Response(body=b"\x89PNG", content_type='image/png')
+        
+        async def declared_large(request):
+            # Only the header is sent: reading the body would fail, so the
+            # page must be skipped on Content-Length alone
+            response = web.StreamResponse(headers={'Content-Type': 'text/html'})
+            response.content_length = 5000
+            await response.prepare(request)
+            await response.write(b"<html>")
+            request.transport.close()
+            return response
+        
+        async def large_chunked(request):
+            # No Content-Length, so the size is only known while reading
+            response = web.StreamResponse(headers={'Content-Type': 'text/html'})
+            response.enable_chunked_encoding()
+            await response.prepare(request)
+            for i in range(0, len(body), 500):
+                await response.write(body[i:i + 500])
+            await response.write_eof()
+            return response
+        
+        app = web.Application()
+        app.router.add_get('/page', page)
+        app.router.add_get('/image', image)
+        app.router.add_get('/declared-large', declared_large)
+        app.router.add_get('/large-chunked', large_chunked)
+        
+        self.crawler.max_page_bytes = 1000
+        self.crawler.request_delay = 0
+        
+        async def exercise():
+            self.crawler._slots_changed = asyncio.Condition()
+            self.crawler._rate_lock = asyncio.Lock()
+            
+            async with TestServer(app) as server, ClientSession() as session:
+                results = {}
+                for path in ('/page', '/image', '/declared-large', '/large-chunked'):
+                    results[path] = await self.crawler.fetch_html(session, str(server.make_url(path)))
+                return results
+        
+        results = asyncio.run(exercise())
+        
+        self.assertEqual(results['/page'], "<html><body>Hello</body></html>")
+        self.assertIsNone(results['/image'])
+        self.assertIsNone(results['/declared-large'])
+        self.assertIsNone(results['/large-chunked'])
+        self.assertEqual(self.crawler._in_flight, 0)
+    
+    def test_crawl_page_filters_links_of_kept_pages_only(self):
+        """Test that links are only checked for pages with enough content to keep."""
+        short_html = '<html><body><p>Too short.</p><a href="/a">A</a></body></html>'
+        long_html = f'<html><body><p>{"Enough text. " * 20}</p><a href="/a">A</a></body></html>'
+        
+        with patch.object(WebCrawler, 'filter_links', autospec=True,
+                          side_effect=WebCrawler.filter_links) as filter_links:
+            with patch.object(WebCrawler, 'fetch_html', return_value=short_html):
+                self.assertIsNone(asyncio.run(self.crawler.crawl_page(None, self.base_url, 0)))
+            filter_links.assert_not_called()
+            
+            with patch.object(WebCrawler, 'fetch_html', return_value=long_html):
+                result = asyncio.run(self.crawler.crawl_page(None, self.base_url, 0))
+            filter_links.assert_called_once()
+        
+        self.assertEqual(result['links'], ["https://example.com/a"])
+    
+    def test_crawl_parses_in_worker_processes(self):
+        """Test that pages are parsed in started (not forked) worker processes when extract_workers is set."""
+        html = f'<html><head><title>Home</title></head><body><p>{"Enough text. " * 20}</p></body></html>'
+        crawler = WebCrawler(self.base_url, max_depth=0, max_pages=1, extract_workers=1)
+        
+        with patch.object(WebCrawler, 'fetch_html', return_value=html), \
+                patch('src.crawler.multiprocessing.get_context', wraps=multiprocessing.get_context) as get_context:
+            pages = asyncio.run(crawler.crawl())
+        
+        self.assertEqual([page['title'] for page in pages], ["Home"])
+        self.assertIn(get_context.call_args.args[0], ("forkserver", "spawn"))
+        self.assertIsNone(crawler._extract_pool)
+    
+    def test_crawl_respects_max_pages(self):
+        """Test that concurrent crawling stops at the page budget."""
+        async def fake_crawl_page(session, url, depth):
+            content = {'url': url, 'text_length': 200, 'depth': depth}
+            self.crawler.crawled_data.append(content)
+            links = [f"https://example.com/{depth}-{i}" for i in range(20)]
+            return {'content': content, 'links': links}
+        
+        with patch.object(WebCrawler, 'crawl_page', side_effect=fake_crawl_page):
+            pages = asyncio.run(self.crawler.crawl())
+        
+        self.assertEqual(len(pages), 10)
+        self.assertEqual(pages[0]['url'], self.base_url)
+        self.assertEqual(len(set(page['url'] for page in pages)), 10)
+    
+    def test_crawl_fetches_each_depth_concurrently(self):
+        """Test that all pages of a depth level are crawled at the same time."""
+        in_flight = [0]
+        max_in_flight = [0]
+        
+        async def fake_crawl_page(session, url, depth):
+            in_flight[0] += 1
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            await asyncio.sleep(0.01)
+            in_flight[0] -= 1
+            
+            content = {'url': url, 'text_length': 200, 'depth': depth}
+            self.crawler.crawled_data.append(content)
+            links = [f"https://example.com/{depth}-{i}" for i in range(9)]
+            return {'content': content, 'links': links}
+        
+        with patch.object(WebCrawler, 'crawl_page', side_effect=fake_crawl_page):
+            pages = asyncio.run(self.crawler.crawl())
+        
+        # Base page alone at depth 0, then its 9 links together at depth 1
+        self.assertEqual(len(pages), 10)
+        self.assertEqual(max_in_flight[0], 9)
+    
+    def test_crawl_stops_when_requested(self):
+        """Test that should_stop ends the crawl after the current batch."""
+        async def fake_crawl_page(session, url, depth):
+            content = {'url': url, 'text_length': 200, 'depth': depth}
+            self.crawler.crawled_data.append(content)
+            links = [f"https://example.com/{depth}-{i}" for i in range(5)]
+            return {'content': content, 'links': links}
+        
+        self.crawler.should_stop = lambda: len(self.crawler.crawled_data) >= 1
+        
+        with patch.object(WebCrawler, 'crawl_page', side_effect=fake_crawl_page):
+            pages = asyncio.run(self.crawler.crawl())
+        
+        self.assertEqual([page['url'] for page in pages], [self.base_url])
+    
+    def test_crawl_resumes_from_state(self):
+        """Test that a persisted crawl picks up where it stopped."""
+        async def fake_crawl_page(crawler, session, url, depth):
+            content = {'url': url, 'text_length': 200, 'depth': depth}
+            crawler.crawled_data.append(content)
+            links = [f"https://example.com/{depth}-{i}" for i in range(20)]
+            return {'content': content, 'links': links}
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            state_path = os.path.join(tmp_dir, "crawl.db")
+            
+            with patch.object(WebCrawler, 'crawl_page', autospec=True, side_effect=fake_crawl_page):
+                first = WebCrawler(self.base_url, max_pages=5, state_path=state_path)
+                first_pages = asyncio.run(first.crawl())
+                
+                second = WebCrawler(self.base_url, max_pages=10, state_path=state_path)
+                second_pages = asyncio.run(second.crawl())
+            
+            self.assertEqual(len(first_pages), 5)
+            self.assertEqual(len(second_pages), 10)
+            self.assertEqual(second_pages[:5], first_pages)
+            self.assertEqual(len(set(page['url'] for page in second_pages)), 10)
+    
+    def test_stopped_crawl_requeues_unfetched_urls(self):
+        """Test that URLs left unfetched by a stopped crawl are fetched when it resumes."""
+        stop = False
+        
+        async def fake_crawl_page(crawler, session, url, depth):
+            nonlocal stop
+            if url != self.base_url:
+                stop = True
+                return None
+            content = {'url': url, 'text_length': 200, 'depth': depth}
+            crawler.crawled_data.append(content)
+            return {'content': content, 'links': ["https://example.com/a", "https://example.com/b"]}
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            state_path = os.path.join(tmp_dir, "crawl.db")
+            
+            with patch.object(WebCrawler, 'crawl_page', autospec=True, side_effect=fake_crawl_page):
+                first = WebCrawler(self.base_url, state_path=state_path, should_stop=lambda: stop)
+                asyncio.run(first.crawl())
+                self.assertIsNone(first.state.con)
+                self.assertEqual(first.get_stats()['urls_visited'], 1)
+            
+            with patch.object(WebCrawler, 'crawl_page', autospec=True, return_value=None) as crawl_page:
+                second = WebCrawler(self.base_url, state_path=state_path)
+                asyncio.run(second.crawl())
+            
+            fetched = sorted(call.args[2] for call in crawl_page.call_args_list)
+            self.assertEqual(fetched, ["https://example.com/a", "https://example.com/b"])
+            self.assertEqual(second.get_stats()['urls_visited'], 3)
+    
+    def test_enqueue_deduplicates_urls(self):
+        """Test that queued or visited URLs are never queued again, in memory or persisted."""
+        from collections import deque
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for state_path in (None, os.path.join(tmp_dir, "crawl.db")):
+                crawler = WebCrawler(self.base_url, state_path=state_path)
+                queue = deque()
+                crawler._enqueue(queue, "https://example.com/a", 1)
+                crawler._enqueue(queue, "https://example.com/b", 2)
+                crawler._enqueue(queue, "https://example.com/a", 1)
+                
+                self.assertEqual(crawler._next_batch(queue, 10), [("https://example.com/a", 1)])
+                crawler._enqueue(queue, "https://example.com/a", 2)
+                self.assertEqual(crawler._next_batch(queue, 10), [("https://example.com/b", 2)])
+                self.assertEqual(crawler._next_batch(queue, 10), [])
+                
+                if crawler.state is not None:
+                    crawler.state.close()
 
 
 class TestChunking(unittest.TestCase):
@@ -170,6 +589,467 @@ class TestChunking(unittest.TestCase):
             self.assertIn('url', chunk)
             self.assertIn('title', chunk)
             self.assertIn('chunk_index', chunk)
+    
+    def test_split_text_breaks_at_separators(self):
+        """Test that chunks are split at separators rather than at fixed offsets."""
+        from src.knowledge_base import split_text
+        
+        text = "This is a sentence. " * 100
+        chunks = split_text(text, chunk_size=500, chunk_overlap=50)
+        
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 500)
+            # No word is cut in half
+            self.assertLessEqual(set(chunk.replace('.', ' ').split()), {"This", "is", "a", "sentence"})
+            
+            # Chunks hold whole sentences
+            self.assertTrue(chunk.startswith("This is"), chunk[:20])
+            self.assertTrue(chunk.endswith("sentence."), chunk[-20:])
+    
+    def test_split_text_overlap_equal_to_chunk_size(self):
+        """Test that an overlap as large as the chunk size, which the app allows, still splits."""
+        from src.knowledge_base import split_text
+        
+        text = "This is a sentence. " * 100
+        chunks = split_text(text, chunk_size=500, chunk_overlap=500)
+        
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 500)
+    
+    def test_split_text_without_semantic_text_splitter(self):
+        """Test that the LangChain fallback splits the same way when semantic-text-splitter is missing."""
+        from src.knowledge_base import split_text, _get_text_splitter
+        
+        _get_text_splitter.cache_clear()
+        self.addCleanup(_get_text_splitter.cache_clear)
+        
+        text = "This is a sentence. " * 100
+        with patch('src.knowledge_base.TextSplitter', None):
+            chunks = split_text(text, chunk_size=500, chunk_overlap=50)
+        
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 500)
+            self.assertTrue(chunk.startswith("This is"), chunk[:20])
+            self.assertTrue(chunk.endswith("sentence."), chunk[-20:])
+
+
+class TestKnowledgeBaseSearch(unittest.TestCase):
+    """Test vector search with a stub embedding model."""
+    
+    def setUp(self):
+        """Load each test's stub model rather than one cached by an earlier test."""
+        from src.knowledge_base import load_embedding_model
+        
+        load_embedding_model.cache_clear()
+        self.addCleanup(load_embedding_model.cache_clear)
+    
+    def _stub_model(self, vectors):
+        """Create a model whose encode() looks up fixed vectors (unnormalized) by text."""
+        import numpy as np
+        import torch
+        
+        def encode(texts, convert_to_tensor=False, **kwargs):
+            embeddings = np.array([vectors[t] for t in texts], dtype='float32')
+            return torch.from_numpy(embeddings) if convert_to_tensor else embeddings
+        
+        model = Mock()
+        model.encode.side_effect = encode
+        return model
+    
+    def test_search_scores_are_cosine_similarities(self):
+        """Test that unnormalized embeddings are normalized in place before search."""
+        from src.knowledge_base import KnowledgeBase
+        
+        vectors = {"test": [1.0, 0.0], "a": [3.0, 0.0], "b": [0.0, 5.0], "c": [3.0, 1.0]}
+        model = self._stub_model(vectors)
+        
+        with patch('sentence_transformers.SentenceTransformer', return_value=model):
+            kb = KnowledgeBase(index_type='flat')
+        
+        chunks = [{'text': text, 'url': f"https://example.com/{text}"} for text in ("a", "b", "c")]
+        kb.build_vector_store(chunks, kb.create_embeddings(["a", "b", "c"]), dtype='float32')
+        
+        results = kb.search("c", top_k=3)
+        
+        self.assertEqual([result['text'] for result in results], ["c", "a", "b"])
+        self.assertAlmostEqual(results[0]['similarity_score'], 1.0, places=5)
+        self.assertAlmostEqual(results[1]['similarity_score'], 3 / 10 ** 0.5, places=5)
+        self.assertAlmostEqual(results[2]['similarity_score'], 1 / 10 ** 0.5, places=5)
+        
+        # Batched search returns the same results in query order
+        batch_results = kb.search_batch(["c", "b"], top_k=3)
+        self.assertEqual(batch_results[0], results)
+        self.assertEqual([result['text'] for result in batch_results[1]], ["b", "c", "a"])
+    
+    def test_sharded_search_matches_flat(self):
+        """Test that a sharded index returns the same results and saves as one index."""
+        import numpy as np
+        from src.knowledge_base import KnowledgeBase
+        
+        rng = np.random.default_rng(0)
+        texts = [str(i) for i in range(50)]
+        vectors = dict(zip(texts + ["test"], rng.random((51, 8), dtype='float32')))
+        model = self._stub_model(vectors)
+        
+        with patch('sentence_transformers.SentenceTransformer', return_value=model):
+            flat_kb = KnowledgeBase(index_type='flat')
+            sharded_kb = KnowledgeBase(index_type='flat')
+            loaded_kb = KnowledgeBase(index_type='flat')
+        
+        chunks = [{'text': text} for text in texts]
+        embeddings = np.array([vectors[t] for t in texts])
+        flat_kb.build_vector_store(chunks, embeddings.copy())
+        
+        sharded_kb.SHARD_MIN_CHUNKS = 10
+        with patch('src.knowledge_base.os.cpu_count', return_value=4):
+            sharded_kb.build_vector_store(chunks, embeddings.copy())
+            
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                sharded_kb.save(tmp_dir)
+                loaded_kb.SHARD_MIN_CHUNKS = 10
+                loaded_kb.load(tmp_dir)
+        
+        self.assertEqual(len(sharded_kb._shards), 4)
+        self.assertEqual(len(loaded_kb._shards), 4)
+        expected = [result['text'] for result in flat_kb.search("7", top_k=5)]
+        self.assertEqual([result['text'] for result in sharded_kb.search("7", top_k=5)], expected)
+        self.assertEqual([result['text'] for result in loaded_kb.search("7", top_k=5)], expected)
+    
+    def test_model_is_loaded_once(self):
+        """Test that knowledge bases with the same model share one loaded model."""
+        from src.knowledge_base import KnowledgeBase
+        
+        model = self._stub_model({"test": [1.0, 0.0]})
+        
+        with patch('sentence_transformers.SentenceTransformer', return_value=model) as model_class:
+            kb = KnowledgeBase(index_type='flat')
+            other_kb = KnowledgeBase(index_type='hnsw')
+        
+        model_class.assert_called_once()
+        self.assertIs(other_kb.model, kb.model)
+        self.assertEqual(other_kb.dimension, 2)
+    
+    def test_embedding_cache_evicts_least_recently_used(self):
+        """Test that a shared embedding cache stays bounded and builds still get every embedding."""
+        import numpy as np
+        from src.knowledge_base import KnowledgeBase, EmbeddingCache
+        
+        cache = EmbeddingCache(max_entries=2)
+        cache['a'] = np.zeros(2)
+        cache['b'] = np.zeros(2)
+        cache['a']
+        cache['c'] = np.zeros(2)
+        self.assertEqual(list(cache), ['a', 'c'])
+        
+        model = self._stub_model({"test": [1.0, 0.0], "x": [1.0, 0.0], "y": [0.0, 1.0], "z": [1.0, 1.0]})
+        with patch('sentence_transformers.SentenceTransformer', return_value=model):
+            kb = KnowledgeBase(index_type='flat', embedding_cache=EmbeddingCache(max_entries=2))
+        
+        embeddings = kb.create_embeddings(["x", "y", "z", "x"])
+        
+        np.testing.assert_array_equal(embeddings, [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0], [1.0, 0.0]])
+        self.assertEqual(len(kb.embedding_cache), 2)
+    
+    def test_save_writes_only_own_embeddings(self):
+        """Test that saving a knowledge base with a shared cache writes only its own chunks' embeddings."""
+        import numpy as np
+        from src.knowledge_base import KnowledgeBase, EmbeddingCache
+        
+        cache = EmbeddingCache()
+        model = self._stub_model({"test": [1.0, 0.0], "a": [1.0, 0.0], "b": [0.0, 1.0]})
+        with patch('sentence_transformers.SentenceTransformer', return_value=model):
+            kb = KnowledgeBase(index_type='flat', embedding_cache=cache)
+            other_kb = KnowledgeBase(index_type='flat', embedding_cache=cache)
+        
+        other_kb.create_embeddings(["b"])
+        kb.build_vector_store([{'text': "a"}], kb.create_embeddings(["a"]), dtype='float32')
+        self.assertEqual(len(cache), 2)
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            kb.save(tmp_dir)
+            with np.load(os.path.join(tmp_dir, 'embedding_cache.npz')) as saved:
+                self.assertEqual(saved['keys'].tolist(), [kb._embedding_key("a")])
+                np.testing.assert_array_equal(saved['embeddings'], [[1.0, 0.0]])
+    
+    def test_load_with_other_model_keeps_shared_cache(self):
+        """Test that loading a knowledge base built with another model keeps using the injected cache."""
+        from src.knowledge_base import KnowledgeBase, EmbeddingCache
+        
+        cache = EmbeddingCache()
+        model = self._stub_model({"test": [1.0, 0.0], "a": [1.0, 0.0]})
+        with patch('sentence_transformers.SentenceTransformer', return_value=model):
+            other_model_kb = KnowledgeBase(embedding_model='other-model', index_type='flat')
+            kb = KnowledgeBase(index_type='flat', embedding_cache=cache)
+            
+            other_model_kb.build_vector_store([{'text': "a"}], other_model_kb.create_embeddings(["a"]))
+            kb.create_embeddings(["a"])
+            
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                other_model_kb.save(tmp_dir)
+                kb.load(tmp_dir)
+                
+                # Release the memory map before the directory is removed
+                chunks = list(kb.chunks)
+                kb.chunks = []
+        
+        self.assertEqual(chunks, ["a"])
+        self.assertIs(kb.embedding_cache, cache)
+        self.assertEqual(kb.embedding_model_name, 'other-model')
+        
+        # The same text has one entry per model
+        self.assertEqual(len(cache), 2)
+    
+    def test_float32_embeddings_are_not_copied(self):
+        """Test that contiguous float32 embeddings are normalized in place rather than copied."""
+        import numpy as np
+        from src.knowledge_base import KnowledgeBase
+        
+        with patch('sentence_transformers.SentenceTransformer', return_value=self._stub_model({"test": [1.0, 0.0]})):
+            kb = KnowledgeBase(index_type='flat')
+        
+        embeddings = np.array([[3.0, 4.0], [0.0, 2.0]], dtype='float32')
+        kb.build_vector_store([{'text': "a"}, {'text': "b"}], embeddings, dtype='float32')
+        
+        np.testing.assert_allclose(embeddings, [[0.6, 0.8], [0.0, 1.0]], rtol=1e-6)
+    
+    def test_duplicate_chunks_are_dropped(self):
+        """Test that boilerplate repeated across pages is embedded and indexed once."""
+        from src.knowledge_base import KnowledgeBase
+        
+        model = self._stub_model({"test": [1.0, 0.0], "footer": [1.0, 0.0], "about": [0.0, 1.0]})
+        
+        with patch('sentence_transformers.SentenceTransformer', return_value=model):
+            kb = KnowledgeBase(index_type='flat')
+        
+        pages = [
+            {'url': "https://example.com/", 'text': "footer"},
+            {'url': "https://example.com/about", 'text': "about"},
+            {'url': "https://example.com/contact", 'text': "footer"}
+        ]
+        kb.build_from_crawled_data(pages)
+        
+        self.assertEqual(list(kb.chunks), ["footer", "about"])
+        self.assertEqual(kb.chunk_metadata[0]['url'], "https://example.com/")
+        self.assertEqual(kb.index.ntotal, 2)
+        self.assertEqual(model.encode.call_args[0][0], ["footer", "about"])
+    
+    def test_save_load_round_trip(self):
+        """Test that a saved knowledge base loads with memory-mapped texts and the same results."""
+        from src.knowledge_base import KnowledgeBase, ChunkTexts
+        
+        vectors = {"test": [1.0, 0.0], "héllo": [3.0, 0.0], "wörld ✓": [0.0, 5.0], "": [3.0, 1.0]}
+        model = self._stub_model(vectors)
+        
+        with patch('sentence_transformers.SentenceTransformer', return_value=model):
+            kb = KnowledgeBase(index_type='flat')
+            loaded_kb = KnowledgeBase(index_type='flat')
+        
+        chunks = [{'text': text, 'url': f"https://example.com/{i}", 'title': "Home", 'chunk_index': i}
+                  for i, text in enumerate(["héllo", "wörld ✓", ""])]
+        kb.build_vector_store(chunks, kb.create_embeddings([chunk['text'] for chunk in chunks]))
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            kb.save(tmp_dir)
+            loaded_kb.load(tmp_dir)
+            
+            self.assertIsInstance(loaded_kb.chunks, ChunkTexts)
+            self.assertEqual(list(loaded_kb.chunks), ["héllo", "wörld ✓", ""])
+            self.assertEqual(loaded_kb.chunks[-2], "wörld ✓")
+            self.assertEqual(loaded_kb.search("test", top_k=3), kb.search("test", top_k=3))
+            self.assertIs(loaded_kb.chunk_metadata[0]['title'], loaded_kb.chunk_metadata[2]['title'])
+            
+            # Release the memory map before the directory is removed
+            del loaded_kb
+    
+    def test_save_back_to_loaded_directory(self):
+        """Test that a loaded knowledge base can be saved over the files its texts are mapped from."""
+        from src.knowledge_base import KnowledgeBase
+        
+        vectors = {"test": [1.0, 0.0], "héllo": [3.0, 0.0], "wörld ✓": [0.0, 5.0]}
+        model = self._stub_model(vectors)
+        
+        with patch('sentence_transformers.SentenceTransformer', return_value=model):
+            kb = KnowledgeBase(index_type='flat')
+            loaded_kb = KnowledgeBase(index_type='flat')
+            reloaded_kb = KnowledgeBase(index_type='flat')
+        
+        chunks = [{'text': text, 'url': f"https://example.com/{i}"} for i, text in enumerate(["héllo", "wörld ✓"])]
+        kb.build_vector_store(chunks, kb.create_embeddings([chunk['text'] for chunk in chunks]))
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            kb.save(tmp_dir)
+            loaded_kb.load(tmp_dir)
+            loaded_kb.save(tmp_dir)
+            reloaded_kb.load(tmp_dir)
+            
+            self.assertEqual(list(loaded_kb.chunks), ["héllo", "wörld ✓"])
+            self.assertEqual(list(reloaded_kb.chunks), ["héllo", "wörld ✓"])
+            self.assertEqual(reloaded_kb.search("test", top_k=2), kb.search("test", top_k=2))
+            
+            # Release the memory maps before the directory is removed
+            del loaded_kb, reloaded_kb
+
+
+class TestRAGPipeline(unittest.TestCase):
+    """Test the RAG pipeline with a stub knowledge base and stub LLM clients."""
+    
+    CONTEXT = [{'text': "We are open 9-5.", 'url': "https://example.com/hours", 'title': "Hours",
+                'similarity_score': 0.9}]
+    
+    def _pipeline(self, vectors, google_api_key=None):
+        """Create a pipeline whose knowledge base embeds questions as the given (normalized) vectors."""
+        import numpy as np
+        from src.rag_pipeline import RAGPipeline
+        
+        kb = Mock()
+        kb.embed_query.side_effect = lambda question: np.array([vectors[question]], dtype='float32')
+        kb.search.return_value = self.CONTEXT
+        
+        with patch('src.rag_pipeline.Groq') as groq_class, patch('src.rag_pipeline.genai') as genai:
+            pipeline = RAGPipeline(kb, "groq-key", google_api_key)
+        
+        self.assertIs(pipeline.groq_client, groq_class.return_value)
+        if google_api_key:
+            self.assertIs(pipeline.gemini_model, genai.GenerativeModel.return_value)
+        
+        completion = Mock(choices=[Mock(message=Mock(content="Open 9-5."))])
+        pipeline.groq_client.chat.completions.create.return_value = completion
+        return pipeline
+    
+    def test_answer_cache_hit_and_miss(self):
+        """Test that only questions at least ANSWER_CACHE_MIN_SIMILARITY alike share an answer."""
+        import math
+        
+        def at(similarity):
+            return [similarity, math.sqrt(1 - similarity ** 2)]
+        
+        pipeline = self._pipeline({"hours?": [1.0, 0.0], "opening hours?": at(0.98), "open on sunday?": at(0.96)})
+        create = pipeline.groq_client.chat.completions.create
+        
+        response = pipeline.answer_question("hours?")
+        self.assertEqual(response['answer'], "Open 9-5.")
+        self.assertEqual(response['sources'][0]['url'], "https://example.com/hours")
+        self.assertEqual(create.call_count, 1)
+        
+        # Above the threshold: answered from the cache
+        self.assertEqual(pipeline.answer_question("opening hours?"), response)
+        self.assertEqual(create.call_count, 1)
+        
+        # Below it: answered by the LLM
+        pipeline.answer_question("open on sunday?")
+        self.assertEqual(create.call_count, 2)
+    
+    def test_answer_cache_evicts_oldest(self):
+        """Test that the oldest answer is dropped once the cache is full."""
+        pipeline = self._pipeline({"a": [1.0, 0.0, 0.0], "b": [0.0, 1.0, 0.0], "c": [0.0, 0.0, 1.0]})
+        pipeline.ANSWER_CACHE_SIZE = 2
+        create = pipeline.groq_client.chat.completions.create
+        
+        for question in ("a", "b", "c"):
+            pipeline.answer_question(question)
+        self.assertEqual(create.call_count, 3)
+        
+        pipeline.answer_question("c")
+        self.assertEqual(create.call_count, 3)
+        
+        pipeline.answer_question("a")
+        self.assertEqual(create.call_count, 4)
+    
+    def test_answer_cache_only_holds_standalone_questions(self):
+        """Test that follow-up questions, whose answer depends on the conversation, skip the cache."""
+        pipeline = self._pipeline({"hours?": [1.0, 0.0]})
+        create = pipeline.groq_client.chat.completions.create
+        history = [{'role': 'user', 'content': "Hi"}, {'role': 'assistant', 'content': "Hello!"}]
+        
+        pipeline.answer_question("hours?", chat_history=history)
+        pipeline.answer_question("hours?", chat_history=history)
+        self.assertEqual(create.call_count, 2)
+        pipeline.knowledge_base.embed_query.assert_not_called()
+        
+        # A follow-up answer was not cached for standalone questions either
+        pipeline.answer_question("hours?")
+        self.assertEqual(create.call_count, 3)
+        
+        # A question with only user messages before it is still standalone
+        pipeline.answer_question("hours?", chat_history=[{'role': 'user', 'content': "Hi"}])
+        self.assertEqual(create.call_count, 3)
+    
+    def _stream(self, pieces, error=None):
+        """Create a Groq chunk stream of the given text pieces, optionally failing after them."""
+        for piece in pieces:
+            yield Mock(choices=[Mock(delta=Mock(content=piece))])
+        if error:
+            raise error
+    
+    def test_streamed_answers_are_cached_only_when_complete(self):
+        """Test that failed and abandoned streams leave nothing in the answer cache."""
+        pipeline = self._pipeline({"hours?": [1.0, 0.0]})
+        create = pipeline.groq_client.chat.completions.create
+        
+        # Fails midway: the error is shown after the text received so far
+        create.side_effect = lambda **kwargs: self._stream(["Open ", "9-"], ConnectionError("reset"))
+        response = pipeline.answer_question_stream("hours?")
+        self.assertEqual(response['sources'][0]['url'], "https://example.com/hours")
+        pieces = list(response['answer_stream'])
+        self.assertEqual(pieces[:2], ["Open ", "9-"])
+        self.assertIn("reset", pieces[2])
+        
+        # Abandoned after the first piece
+        create.side_effect = lambda **kwargs: self._stream(["Open ", "9-5."])
+        next(pipeline.answer_question_stream("hours?")['answer_stream'])
+        
+        # Complete: cached, so the next identical question doesn't reach the LLM
+        self.assertEqual("".join(pipeline.answer_question_stream("hours?")['answer_stream']), "Open 9-5.")
+        self.assertEqual(create.call_count, 3)
+        
+        response = pipeline.answer_question_stream("hours?")
+        self.assertEqual(list(response['answer_stream']), ["Open 9-5."])
+        self.assertEqual(response['num_sources'], 1)
+        self.assertEqual(create.call_count, 3)
+        self.assertTrue(create.call_args.kwargs['stream'])
+    
+    def test_streaming_falls_back_to_gemini(self):
+        """Test that Gemini streams the answer when the Groq request fails."""
+        pipeline = self._pipeline({"hours?": [1.0, 0.0]}, google_api_key="google-key")
+        pipeline.groq_client.chat.completions.create.side_effect = RuntimeError("rate limited")
+        pipeline.gemini_model.generate_content.return_value = iter([Mock(text="Open "), Mock(text="9-5.")])
+        
+        response = pipeline.answer_question_stream("hours?")
+        
+        self.assertEqual(list(response['answer_stream']), ["Open ", "9-5."])
+        self.assertTrue(pipeline.gemini_model.generate_content.call_args.kwargs['stream'])
+    
+    def test_instructions_are_sent_as_system_prompt(self):
+        """Test that Groq gets the instructions as a system message ahead of the per-question prompt."""
+        from src.rag_pipeline import RAGPipeline
+        
+        pipeline = self._pipeline({"hours?": [1.0, 0.0]})
+        pipeline.answer_question("hours?")
+        
+        system, user = pipeline.groq_client.chat.completions.create.call_args.kwargs['messages']
+        self.assertEqual(system, {'role': "system", 'content': RAGPipeline.SYSTEM_PROMPT})
+        self.assertEqual(user['role'], "user")
+        self.assertIn("We are open 9-5.", user['content'])
+        self.assertNotIn("Instructions:", user['content'])
+    
+    def test_answer_falls_back_to_gemini_with_instructions(self):
+        """Test that Gemini answers when Groq fails, with the instructions prefixed to its prompt."""
+        from src.rag_pipeline import RAGPipeline
+        
+        pipeline = self._pipeline({"hours?": [1.0, 0.0]}, google_api_key="google-key")
+        pipeline.groq_client.chat.completions.create.side_effect = RuntimeError("rate limited")
+        pipeline.gemini_model.generate_content.return_value = Mock(text="Open 9-5 (Gemini).")
+        
+        response = pipeline.answer_question("hours?")
+        
+        self.assertEqual(response['answer'], "Open 9-5 (Gemini).")
+        self.assertNotIn('error', response)
+        prompt = pipeline.gemini_model.generate_content.call_args.args[0]
+        self.assertTrue(prompt.startswith(RAGPipeline.SYSTEM_PROMPT))
+        self.assertIn("User Question: hours?", prompt)
 
 
 if __name__ == '__main__':